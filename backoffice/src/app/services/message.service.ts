@@ -1,6 +1,6 @@
 // message.service.ts
 import { Injectable, inject } from '@angular/core';
-import { HttpClient, HttpHeaders } from '@angular/common/http';
+import { HttpClient, HttpHeaders, HttpParams } from '@angular/common/http';
 import { Observable, firstValueFrom } from 'rxjs';
 import { environment } from './../../environments/environment';
 
@@ -59,4 +59,22 @@ export class MessageService {
     return firstValueFrom(this.getAllReports$());
   }
 
+  /** GET /export/messagereport
+   *  Exportación por streaming (CSV o NDJSON); el navegador descomprime el gzip
+   */
+  exportReports$(filters: {
+    format?: 'csv' | 'ndjson';
+    from?: string;
+    to?: string;
+    message_id?: number;
+    estado?: string;
+  } = {}): Observable<Blob> {
+    let params = new HttpParams();
+    for (const [key, value] of Object.entries(filters)) {
+      if (value !== undefined && value !== null && value !== '') params = params.set(key, String(value));
+    }
+    const url = `${this.base}/export/messagereport`;
+    return this.http.get(url, { headers: this.headers(), params, responseType: 'blob' });
+  }
+
 }
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: serialización de respuestas BSON.
+
+Compara el camino anterior (json_util.dumps -> json.loads -> json_encode de
+Tornado) contra encoder.encode_json sobre documentos tipo catálogo/reporte.
+
+Uso:
+    python benchmarks/encoder_bench.py [cantidad_documentos] [repeticiones]
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import tracemalloc
+from bson import ObjectId, json_util
+from bson.decimal128 import Decimal128
+from tornado.escape import json_encode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ws"))
+from encoder import encode_json, orjson  # noqa: E402
+
+
+def build_docs(n):
+    now = datetime.datetime.utcnow()
+    return [{
+        "_id": ObjectId(),
+        "item_id": i,
+        "message_id": i % 50,
+        "email": f"usuario.{i % 5000}",
+        "zona": "Quito",
+        "estado": "visto",
+        "monto": Decimal128("12.50"),
+        "timestamp": now - datetime.timedelta(seconds=i),
+    } for i in range(n)]
+
+
+def old_path(docs):
+    return json_encode({'response': json.loads(json_util.dumps(docs)), 'status': 200}).encode()
+
+
+def new_path(docs):
+    return encode_json({'response': docs, 'status': 200})
+
+
+def measure(fn, docs, repeat):
+    fn(docs)  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(docs)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(docs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    docs = build_docs(n)
+
+    assert json.loads(old_path(docs)) == json.loads(new_path(docs)), "las salidas no coinciden"
+
+    backend = "orjson" if orjson is not None else "json"
+    for name, fn in (("json_util + json.loads + json_encode", old_path), (f"encode_json ({backend})", new_path)):
+        elapsed, peak = measure(fn, docs, repeat)
+        print(f"{name:40s} {elapsed * 1000:9.1f} ms  pico {peak / 1024 / 1024:8.1f} MiB  ({n} docs)")
@@ -0,0 +1,68 @@
+"""
+Prueba de concurrencia y rendimiento del asignador de item_id.
+
+Simula K workers (cada uno con su propio IdAllocator, como procesos ws
+distintos) insertando en paralelo contra un mongod local y verifica que no
+haya item_id duplicados. Compara contra un $inc por inserción (camino anterior).
+
+Uso:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/id_allocator_bench.py [workers] [inserciones] [block_size]
+"""
+import os
+import sys
+import time
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ws"))
+from id_allocator import IdAllocator  # noqa: E402
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+CATALOG = "bench_ids"
+
+
+async def run(workers, inserts, block_size, use_allocator):
+    client = AsyncIOMotorClient(MONGO_URI)
+    db = client["bench_id_allocator"]
+    await db.drop_collection(CATALOG)
+    await db["_counters"].delete_one({"_id": CATALOG})
+    collection = db[CATALOG]
+
+    async def lease(catalog, count):
+        result = await db["_counters"].find_one_and_update(
+            {"_id": catalog}, {"$inc": {"seq": count}}, upsert=True, return_document=True
+        )
+        return result["seq"]
+
+    async def worker():
+        allocator = IdAllocator(lease, block_size=block_size)
+        for _ in range(inserts):
+            if use_allocator:
+                item_id = (await allocator.take(CATALOG, 1))[0]
+            else:
+                item_id = await lease(CATALOG, 1)
+            await collection.insert_one({"item_id": item_id})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(workers)])
+    elapsed = time.perf_counter() - start
+
+    total = await collection.count_documents({})
+    distinct = len(await collection.distinct("item_id"))
+    client.close()
+    return total, distinct, elapsed
+
+
+async def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    inserts = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    block_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    for name, use_allocator in (("$inc por inserción", False), (f"hi/lo (bloque {block_size})", True)):
+        total, distinct, elapsed = await run(workers, inserts, block_size, use_allocator)
+        assert total == distinct, f"{name}: {total - distinct} item_id duplicados"
+        print(f"{name:28s} {total} inserciones, sin duplicados, {total / elapsed:9.1f} ins/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
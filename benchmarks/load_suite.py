@@ -0,0 +1,428 @@
+"""
+Suite de carga de ws y monitor con la mezcla real de tráfico de los clientes.
+
+Cliente HTTP asíncrono (tornado.httpclient sobre asyncio) contra ws y un
+publicador AMQP (pika, en su propio hilo) contra `activity_queue`. Requiere ws,
+monitor, MongoDB y RabbitMQ locales (docker-compose-back.yml).
+
+Perfiles:
+- mix: búsquedas de usersgroup/users, sondeo de agendas por grupo (messagesgroup
+  y today), reportes, logins de backoffice y eventos de actividad por AMQP.
+- slow_fast: sondeos rápidos solos y luego junto a consultas de reporte del año
+  completo (las consultas lentas no deben encolar a las rápidas).
+- login_burst: sondeos rápidos solos y luego junto a ráfagas de login (bcrypt
+  fuera del IOLoop; con el pool saturado se espera 503 rápido).
+Para ver el escalado por núcleos, correr `mix` con ws_workers=1,2,4... y comparar.
+
+Cada corrida escribe un JSON con p50/p95/p99 y req/s por endpoint (y por fase),
+junto con el commit, en benchmarks/results/. `compare` contrasta dos corridas.
+
+Uso:
+    python benchmarks/load_suite.py seed
+    python benchmarks/load_suite.py run [--profile mix] [--duration 30] [--concurrency 50] [--events-per-second 200]
+    python benchmarks/load_suite.py compare base.json nuevo.json [--threshold 0.10]
+
+Variables de entorno: WS_URL (http://localhost:5050), jwt_secret y
+RABBITMQ_HOST/RABBITMQ_PORT/RABBITMQ_USERNAME/RABBITMQ_PASSWORD/RABBITMQ_QUEUE.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import jwt
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+WS_URL = os.getenv("WS_URL", "http://localhost:5050").rstrip("/")
+JWT_SECRET = os.getenv("jwt_secret", "supersecreto")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+USERS = 2000
+GROUPS = 20
+MESSAGES = 50
+BENCH_MESSAGE_ID = 9999  # message_id de los eventos de la suite (se cuenta en el resumen)
+MANAGER = {"username": "bench_manager", "password": "bench_password"}
+ZONAS = ("Quito", "Guayaquil", "Cuenca")
+ESTADOS = ("mostrado", "visto", "cerrado")
+
+
+def email(i):
+    return f"bench.{i}@carga.local"
+
+
+def group(i):
+    return f"bench-{i}"
+
+
+# --- Peticiones: nombre -> (método, ruta, cuerpo) ---
+def req_usersgroup():
+    return "GET", f"/search/usersgroup/{quote(email(random.randrange(USERS)))}?fields=group", None
+
+
+def req_users():
+    return "GET", f"/search/users/{quote(email(random.randrange(USERS)))}?fields=email", None
+
+
+def req_messagesgroup():
+    return "GET", f"/search/messagesgroup/{group(random.randrange(GROUPS))}", None
+
+
+def req_today():
+    return "GET", f"/search/today/{quote(email(random.randrange(USERS)))}", None
+
+
+def req_report_summary():
+    return "GET", "/search/messagereport/summary?group_by=message_id,estado", None
+
+
+def req_report_message():
+    return "GET", f"/search/messagereport/{random.randint(1, MESSAGES)}?fields=email,estado,timestamp", None
+
+
+def req_report_year():
+    # Consulta lenta: año completo sin proyección (perfil slow_fast)
+    return "GET", "/search/messagereport", None
+
+
+def req_login():
+    return "POST", "/backoffice/login", json.dumps(MANAGER)
+
+
+REQUESTS = {
+    "usersgroup": req_usersgroup,
+    "users": req_users,
+    "messagesgroup": req_messagesgroup,
+    "today": req_today,
+    "report_summary": req_report_summary,
+    "report_message": req_report_message,
+    "report_year": req_report_year,
+    "login": req_login,
+}
+
+# Pesos relativos de cada mezcla
+MIX = {"usersgroup": 25, "users": 8, "messagesgroup": 40, "today": 12,
+       "report_summary": 8, "report_message": 4, "login": 3}
+FAST = {"usersgroup": 30, "messagesgroup": 55, "today": 15}
+SLOW = {"report_year": 1}
+LOGIN = {"login": 1}
+
+# Perfil -> fases; cada fase reparte los workers entre mezclas (fracción, mezcla)
+PROFILES = {
+    "mix": [("mix", [(1.0, MIX)])],
+    "slow_fast": [("baseline", [(1.0, FAST)]), ("loaded", [(0.5, FAST), (0.5, SLOW)])],
+    "login_burst": [("baseline", [(1.0, FAST)]), ("burst", [(0.5, FAST), (0.5, LOGIN)])],
+}
+
+
+def token():
+    payload = {"sub": "load_suite", "exp": datetime.now(timezone.utc) + timedelta(hours=4)}
+    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def record(self, name, seconds, status):
+        self.latencies.setdefault(name, []).append(seconds)
+        codes = self.statuses.setdefault(name, {})
+        codes[str(status)] = codes.get(str(status), 0) + 1
+        # 404 es una respuesta válida de búsqueda; 503 del pool de contraseñas también es esperado
+        if status >= 500 and status != 503:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        return {name: summarize(values, elapsed, self.errors.get(name, 0), self.statuses[name])
+                for name, values in sorted(self.latencies.items())}
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    # Rango más cercano: el menor valor con al menos q de las muestras por debajo
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(values, elapsed, errors, statuses):
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def send(client, headers, method, path, body):
+    request = HTTPRequest(WS_URL + path, method=method, headers=headers, body=body,
+                          request_timeout=60)
+    start = time.perf_counter()
+    response = await client.fetch(request, raise_error=False)
+    return time.perf_counter() - start, response.code
+
+
+async def worker(client, headers, mix, deadline, recorder):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights)[0]
+        method, path, body = REQUESTS[name]()
+        elapsed, status = await send(client, headers, method, path, body)
+        recorder.record(name, elapsed, status)
+
+
+async def run_phase(client, headers, groups, concurrency, duration):
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    tasks = []
+    for share, mix in groups:
+        for _ in range(max(1, int(round(concurrency * share)))):
+            tasks.append(worker(client, headers, mix, deadline, recorder))
+    start = time.monotonic()
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.monotonic() - start)
+
+
+# --- AMQP ---
+class ActivityPublisher(threading.Thread):
+    """Publica eventos de actividad a ritmo fijo con confirmaciones del broker."""
+
+    def __init__(self, rate):
+        super().__init__(daemon=True)
+        self.rate = rate
+        self.stop_event = threading.Event()
+        self.latencies = []
+        self.errors = 0
+        self.error = None
+
+    def run(self):
+        import pika
+        parameters = pika.ConnectionParameters(
+            host=os.getenv("RABBITMQ_HOST", "localhost"),
+            port=int(os.getenv("RABBITMQ_PORT", 5672)),
+            credentials=pika.PlainCredentials(os.getenv("RABBITMQ_USERNAME", "guest"),
+                                              os.getenv("RABBITMQ_PASSWORD", "guest")))
+        queue = os.getenv("RABBITMQ_QUEUE", "activity_queue")
+        try:
+            connection = pika.BlockingConnection(parameters)
+        except pika.exceptions.AMQPError as e:
+            self.error = str(e)
+            return
+        channel = connection.channel()
+        channel.queue_declare(queue=queue, durable=True)
+        channel.confirm_delivery()
+        interval = 1.0 / self.rate
+        next_at = time.monotonic()
+        sequence = 0
+        while not self.stop_event.is_set():
+            event = {
+                "message_id": BENCH_MESSAGE_ID,
+                "email": email(random.randrange(USERS)),
+                "zona": random.choice(ZONAS),
+                "estado": random.choice(ESTADOS),
+                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "idempotency_key": f"load-{os.getpid()}-{time.time_ns()}-{sequence}",
+            }
+            sequence += 1
+            start = time.perf_counter()
+            try:
+                channel.basic_publish("", queue, json.dumps(event).encode(),
+                                      pika.BasicProperties(delivery_mode=2))
+                self.latencies.append(time.perf_counter() - start)
+            except pika.exceptions.AMQPError:
+                self.errors += 1
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        connection.close()
+
+
+async def ingested_events(client, headers):
+    """Eventos de la suite ya volcados por el monitor (según messagereport_daily)."""
+    request = HTTPRequest(f"{WS_URL}/search/messagereport/summary?message_id={BENCH_MESSAGE_ID}&group_by=message_id",
+                          headers=headers)
+    response = await client.fetch(request, raise_error=False)
+    if response.code != 200:
+        return None
+    rows = json.loads(response.body)["response"]
+    return rows[0]["count"] if rows else 0
+
+
+async def wait_ingest(client, headers, before, published, timeout=60):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        current = await ingested_events(client, headers)
+        if current is not None and current - before >= published:
+            return round(time.monotonic() - start, 2)
+        await asyncio.sleep(0.5)
+    return None
+
+
+# --- Comandos ---
+async def seed():
+    """Crea (una sola vez) usuarios, grupos, agendas de hoy, mensajes y el usuario de backoffice."""
+    client = AsyncHTTPClient()
+    headers = {"Authorization": f"Bearer {token()}", "Content-Type": "application/json"}
+    _, status = await send(client, headers, "GET", f"/search/usersgroup/{quote(email(0))}", None)
+    if status == 200:
+        print("Datos de carga ya presentes")
+        return
+
+    async def post(path, items):
+        for offset in range(0, len(items), 1000):
+            _, status = await send(client, headers, "POST", path, json.dumps(items[offset:offset + 1000]))
+            if status >= 400:
+                raise SystemExit(f"POST {path} respondió {status}")
+
+    await post("/users", [{"email": email(i)} for i in range(USERS)])
+    await post("/usersgroup", [{"email": email(i), "group": group(i % GROUPS)} for i in range(USERS)])
+    await post("/messages", [{"title": f"Mensaje {m}", "body": "Prueba de carga"} for m in range(1, MESSAGES + 1)])
+    today = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0, tzinfo=None)
+    await post("/messagesgroup", [
+        {"group": group(g), "message_id": m, "schedule": (today + timedelta(minutes=m)).isoformat()}
+        for g in range(GROUPS) for m in range(1, 6)
+    ])
+    _, status = await send(client, headers, "POST", "/backoffice/user", json.dumps(MANAGER))
+    print(f"Datos de carga creados (backoffice/user: {status})")
+
+
+def git_commit():
+    try:
+        root = os.path.join(os.path.dirname(__file__), "..")
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=root, text=True).strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+async def run(args):
+    client = AsyncHTTPClient(max_clients=args.concurrency)
+    headers = {"Authorization": f"Bearer {token()}", "Content-Type": "application/json"}
+
+    publisher = None
+    ingested_before = None
+    if args.events_per_second > 0:
+        ingested_before = await ingested_events(client, headers)
+        publisher = ActivityPublisher(args.events_per_second)
+        publisher.start()
+
+    phases = {}
+    for phase, groups in PROFILES[args.profile]:
+        print(f"Fase {phase}: {args.duration} s con {args.concurrency} conexiones...")
+        phases[phase] = await run_phase(client, headers, groups, args.concurrency, args.duration)
+
+    amqp = None
+    if publisher is not None:
+        publisher.stop_event.set()
+        publisher.join()
+        published = len(publisher.latencies)
+        elapsed = args.duration * len(phases)
+        amqp = summarize(publisher.latencies, elapsed, publisher.errors, {}) if published else {}
+        amqp["published"] = published
+        if publisher.error:
+            amqp["error"] = publisher.error
+        if published and ingested_before is not None:
+            # Tiempo hasta que el monitor vuelca todo lo publicado (acumulados diarios)
+            amqp["ingest_drain_seconds"] = await wait_ingest(client, headers, ingested_before, published)
+
+    sha, dirty = git_commit()
+    result = {
+        "commit": sha,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "label": args.label,
+        "profile": args.profile,
+        "config": {"ws_url": WS_URL, "duration": args.duration, "concurrency": args.concurrency,
+                   "events_per_second": args.events_per_second},
+        "phases": phases,
+        "totals": {phase: round(sum(e["rps"] for e in endpoints.values()), 2) for phase, endpoints in phases.items()},
+        "amqp": amqp,
+    }
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{sha or 'nogit'}-{args.profile}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"Resultado guardado en {out}")
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base: {base.get('commit')} {base.get('label') or ''}  ->  nuevo: {new.get('commit')} {new.get('label') or ''}")
+    print(f"{'fase/endpoint':32s} {'req/s':>17s} {'p50 ms':>17s} {'p95 ms':>17s} {'p99 ms':>17s}")
+
+    def cell(a, b):
+        if a in (None, 0) or b is None:
+            return f"{'-':>17s}"
+        return f"{b:9.1f} ({(b - a) / a:+6.1%})"
+
+    regressions = []
+    for phase, endpoints in new["phases"].items():
+        for name, stats in endpoints.items():
+            old = base.get("phases", {}).get(phase, {}).get(name)
+            if old is None:
+                continue
+            print(f"{phase + '/' + name:32s} {cell(old['rps'], stats['rps'])} {cell(old['p50_ms'], stats['p50_ms'])} "
+                  f"{cell(old['p95_ms'], stats['p95_ms'])} {cell(old['p99_ms'], stats['p99_ms'])}")
+            if old["p95_ms"] and (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] > args.threshold:
+                regressions.append(f"{phase}/{name}")
+    for phase, total in new.get("totals", {}).items():
+        old_total = base.get("totals", {}).get(phase)
+        print(f"{phase + '/TOTAL':32s} {cell(old_total, total)}")
+
+    if regressions:
+        print(f"Regresión de p95 mayor a {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de carga de ws y monitor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("seed")
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--profile", choices=sorted(PROFILES), default="mix")
+    run_parser.add_argument("--duration", type=float, default=30, help="segundos por fase")
+    run_parser.add_argument("--concurrency", type=int, default=50)
+    run_parser.add_argument("--events-per-second", type=float, default=200)
+    run_parser.add_argument("--label", default=None, help="p. ej. ws_workers=4")
+    run_parser.add_argument("--out", default=None)
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        asyncio.run(seed())
+    elif args.command == "run":
+        asyncio.run(run(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Espacio en disco y tiempo de consulta de messagereport en ambos formatos.
+
+Carga N eventos sintéticos (por defecto 10M) repartidos uniformemente en
+[ahora - SPAN_DAYS días, ahora] (por defecto 365) en una base de prueba, en
+el formato plano (`messagereport`, con los índices del monitor) y en
+time-series (`messagereport_events`). Luego mide:
+- storageSize + totalIndexSize de cada colección ($collStats)
+- tiempo de la consulta de MessageHandler (año en curso de un message_id)
+  a través de report_store, la misma capa que usan los handlers
+
+Uso:
+    MONGO_URI=mongodb://localhost:27017 SPAN_DAYS=365 python benchmarks/messagereport_storage_bench.py [eventos]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ws"))
+from report_store import ReportStore, TIMESERIES_COLLECTION, META_FIELDS  # noqa: E402
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+BATCH = 10000
+SPAN_DAYS = int(os.getenv("SPAN_DAYS", 365))
+MESSAGES = 50
+
+
+def build_batch(start, count, span_start, step):
+    docs = []
+    for i in range(start, start + count):
+        ts = span_start + step * i
+        doc = {
+            "message_id": random.randint(1, MESSAGES),
+            "email": f"usuario.{random.randint(1, 5000)}@empresa.com",
+            "zona": random.choice(["Quito", "Guayaquil", "Cuenca"]),
+            "estado": random.choice(["mostrado", "visto", "cerrado"]),
+            "timestamp": ts,
+            "item_id": i + 1,
+        }
+        doc["event_key"] = hashlib.blake2b(f"{doc['email']}|{doc['message_id']}|{i}".encode(), digest_size=16).hexdigest()
+        docs.append(doc)
+    return docs
+
+
+def to_timeseries(doc):
+    row = {k: v for k, v in doc.items() if k not in META_FIELDS}
+    row["meta"] = {k: doc[k] for k in META_FIELDS}
+    return row
+
+
+async def load(db, total):
+    await db.drop_collection("messagereport")
+    await db.drop_collection(TIMESERIES_COLLECTION)
+    plain = db["messagereport"]
+    await plain.create_index([("email", ASCENDING)])
+    await plain.create_index([("timestamp", ASCENDING)])
+    await plain.create_index([("message_id", ASCENDING), ("timestamp", ASCENDING)])
+    await plain.create_index([("event_key", ASCENDING)], unique=True)
+    await db.create_collection(TIMESERIES_COLLECTION, timeseries={
+        "timeField": "timestamp", "metaField": "meta", "granularity": "minutes"
+    })
+    series = db[TIMESERIES_COLLECTION]
+    await series.create_index([("meta.message_id", ASCENDING), ("timestamp", ASCENDING)])
+    await series.create_index([("event_key", ASCENDING)])
+
+    # Timestamps repartidos en el intervalo: la cantidad no depende de la fecha actual
+    now = datetime.now(timezone.utc)
+    span_start = now - timedelta(days=SPAN_DAYS)
+    step = (now - span_start) / total
+    start = time.perf_counter()
+    for offset in range(0, total, BATCH):
+        docs = build_batch(offset, min(BATCH, total - offset), span_start, step)
+        rows = [to_timeseries(d) for d in docs]
+        await asyncio.gather(plain.insert_many(docs, ordered=False), series.insert_many(rows, ordered=False))
+        if offset and offset % 1000000 == 0:
+            print(f"  {offset:,} eventos cargados ({time.perf_counter() - start:.0f} s)")
+    return total
+
+
+async def footprint(db, name):
+    cursor = db[name].aggregate([{"$collStats": {"storageStats": {}}}])
+    stats = (await cursor.to_list(length=1))[0]["storageStats"]
+    return stats.get("storageSize", 0), stats.get("totalIndexSize", 0)
+
+
+async def main(total):
+    client = AsyncIOMotorClient(MONGO_URI)
+    db = client["bench_messagereport"]
+    total = await load(db, total)
+    print(f"{total:,} eventos por formato")
+
+    now = datetime.now(timezone.utc)
+    year_start = datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    for storage in ("documents", "timeseries"):
+        store = ReportStore(storage)
+        storage_size, index_size = await footprint(db, store.collection_name)
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            events = await store.find_events(db, year_start, now, random.randint(1, MESSAGES))
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{storage:11s} datos: {storage_size / 2**20:9.1f} MB  índices: {index_size / 2**20:8.1f} MB  "
+              f"consulta message_id ({len(events):,} eventos): mediana {timings[2] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000))
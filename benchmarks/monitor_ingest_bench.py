@@ -0,0 +1,75 @@
+"""
+Benchmark de normalización de lotes del monitor sobre 100k mensajes sintéticos.
+
+Compara el camino anterior (json.loads + dateutil.parser.parse + normalize_utc
+por mensaje) contra ingest.decodificar_lote + ingest.normalizar_lote.
+
+Uso:
+    python benchmarks/monitor_ingest_bench.py [cantidad_mensajes]
+"""
+import os
+import sys
+import json
+import time
+import random
+from datetime import datetime, timedelta, timezone
+from dateutil import parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "monitor"))
+from ingest import normalize_utc, clave_evento, decodificar_lote, normalizar_lote, parse_timestamp  # noqa: E402
+
+
+def build_bodies(n):
+    # Ráfagas realistas: muchos eventos por segundo, formato de ActivityLogger
+    base = datetime(2025, 8, 27, 10, 0, 0)
+    return [json.dumps({
+        "message_id": random.randint(1, 50),
+        "email": f"usuario.{random.randint(1, 5000)}",
+        "zona": random.choice(["Quito", "Guayaquil", "Cuenca"]),
+        "estado": random.choice(["mostrado", "visto", "cerrado"]),
+        "timestamp": (base + timedelta(seconds=i // 20)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }).encode() for i in range(n)]
+
+
+def old_path(bodies):
+    now_utc = datetime.now(timezone.utc)
+    documentos = []
+    for i, body in enumerate(bodies):
+        mensaje = json.loads(body.decode("utf-8"))
+        ts_raw = mensaje.get("timestamp")
+        try:
+            ts_parsed = parser.parse(ts_raw) if ts_raw else None
+        except Exception:
+            ts_parsed = None
+        documento = {
+            "message_id": mensaje.get("message_id"),
+            "email": mensaje.get("email"),
+            "zona": mensaje.get("zona"),
+            "estado": mensaje.get("estado"),
+            "timestamp": normalize_utc(ts_parsed) or now_utc,
+            "item_id": i + 1
+        }
+        # La clave de idempotencia es parte del documento en ambos caminos
+        clave = clave_evento(mensaje, ts_raw)
+        if clave is not None:
+            documento["event_key"] = clave
+        documentos.append(documento)
+    return documentos
+
+
+def new_path(bodies):
+    return normalizar_lote(decodificar_lote(bodies), 1, datetime.now(timezone.utc))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bodies = build_bodies(n)
+
+    assert old_path(bodies[:1000]) == new_path(bodies[:1000]), "las salidas no coinciden"
+
+    for name, fn in (("dateutil por mensaje", old_path), ("fromisoformat + caché + lote", new_path)):
+        parse_timestamp.cache_clear()
+        start = time.perf_counter()
+        fn(bodies)
+        elapsed = time.perf_counter() - start
+        print(f"{name:32s} {elapsed * 1000:9.1f} ms  ({n / elapsed:,.0f} msg/s)")
@@ -0,0 +1,151 @@
+"""
+Rendimiento del registro local del monitor durante una caída simulada de MongoDB.
+
+Un productor entrega lotes como lo haría RabbitMQ; MongoDB se reemplaza por un
+sumidero en memoria que falla durante `caida` segundos y luego acepta inserts
+con una latencia fija por lote. Se compara:
+- directo: insert en el hilo del consumidor; si falla, el lote se reencola
+  (nack) y vuelve a entregarse, como antes del registro local.
+- registro: spill.SegmentLog + hilo volcador con backoff, como monitor/main.py.
+
+Reporta mensajes confirmados por segundo durante la caída, tiempo total hasta
+que todo llega al sumidero y verifica que no falten ni se dupliquen mensajes.
+En el modo registro, la limpieza periódica (clean_users) corre cada
+`caida / 10` segundos contra el sumidero caído, como en consumir(): se verifica
+que sus fallos no detengan el consumo en una caída más larga que el intervalo.
+
+Uso:
+    python benchmarks/monitor_spill_bench.py [mensajes] [segundos_de_caida]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "monitor"))
+from spill import SegmentLog  # noqa: E402
+
+BATCH = 1000
+LATENCIA_LOTE = 0.005
+
+
+class SumideroSimulado:
+    """Sustituto local de messagereport: falla hasta `hasta` y deduplica por clave."""
+
+    def __init__(self, caida):
+        self.hasta = time.monotonic() + caida
+        self.claves = set()
+        self.insertados = 0
+
+    def insert_many(self, cuerpos):
+        if time.monotonic() < self.hasta:
+            time.sleep(0.05)  # timeout de conexión
+            raise ConnectionError("MongoDB no disponible")
+        time.sleep(LATENCIA_LOTE)
+        for cuerpo in cuerpos:
+            clave = json.loads(cuerpo)["idempotency_key"]
+            if clave not in self.claves:
+                self.claves.add(clave)
+                self.insertados += 1
+
+    def limpiar(self):
+        """Sustituto de clean_users(): falla mientras MongoDB esté caído."""
+        if time.monotonic() < self.hasta:
+            raise ConnectionError("MongoDB no disponible")
+
+
+def mensajes(n):
+    return [json.dumps({"idempotency_key": str(i), "email": f"u{i % 500}"}).encode() for i in range(n)]
+
+
+def directo(cola, sumidero, caida):
+    confirmados_en_caida = 0
+    inicio = time.monotonic()
+    while cola:
+        lote = [cola.popleft() for _ in range(min(BATCH, len(cola)))]
+        try:
+            sumidero.insert_many(lote)
+            if time.monotonic() - inicio < caida:
+                confirmados_en_caida += len(lote)
+        except ConnectionError:
+            cola.extendleft(reversed(lote))  # nack + requeue: se vuelve a entregar
+    return confirmados_en_caida, time.monotonic() - inicio
+
+
+def con_registro(cola, sumidero, caida, directorio):
+    registro = SegmentLog(directorio)
+    total = len(cola)
+    terminado = threading.Event()
+
+    def volcador():
+        espera = 0.1
+        while not terminado.is_set():
+            cuerpos, posicion = registro.leer(BATCH, timeout=0.05)
+            try:
+                if cuerpos:
+                    sumidero.insert_many(cuerpos)
+                if posicion != registro.posicion:
+                    registro.confirmar(posicion)
+                espera = 0.1
+            except ConnectionError:
+                time.sleep(espera)
+                espera = min(espera * 2, 1.0)
+            if sumidero.insertados >= total:
+                terminado.set()
+
+    hilo = threading.Thread(target=volcador, daemon=True)
+    inicio = time.monotonic()
+    hilo.start()
+    confirmados_en_caida = 0
+    intervalo_limpieza = caida / 10
+    proxima_limpieza = inicio
+    limpiezas_fallidas = 0
+    pico = 0
+    # Como consumir(): el bucle sigue vivo con la cola vacía (inactivity_timeout)
+    while not terminado.is_set():
+        if cola:
+            lote = [cola.popleft() for _ in range(min(BATCH, len(cola)))]
+            registro.agregar(lote)  # fsync y ack
+            if time.monotonic() - inicio < caida:
+                confirmados_en_caida += len(lote)
+            pico = max(pico, registro.pendientes)
+        else:
+            terminado.wait(0.05)
+        if time.monotonic() >= proxima_limpieza:
+            # Igual que consumir(): un fallo de la limpieza se registra y se reintenta
+            try:
+                sumidero.limpiar()
+            except ConnectionError:
+                limpiezas_fallidas += 1
+            proxima_limpieza = time.monotonic() + intervalo_limpieza
+    hilo.join()
+    registro.cerrar()
+    return confirmados_en_caida, time.monotonic() - inicio, pico, limpiezas_fallidas
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    caida = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    cuerpos = mensajes(n)
+
+    sumidero = SumideroSimulado(caida)
+    en_caida, total = directo(deque(cuerpos), sumidero, caida)
+    assert sumidero.insertados == n
+    print(f"{'directo (nack + requeue)':28s} confirmados en caída: {en_caida:8d} ({en_caida / caida:10,.0f} msg/s)"
+          f"  total: {total:6.2f} s")
+
+    directorio = tempfile.mkdtemp(prefix="monitor_spill_")
+    try:
+        sumidero = SumideroSimulado(caida)
+        en_caida, total, pico, fallidas = con_registro(deque(cuerpos), sumidero, caida, directorio)
+        assert sumidero.insertados == n and len(sumidero.claves) == n
+        assert fallidas >= 2, "la caída no cubrió más de un intervalo de limpieza"
+        print(f"{'registro local + volcador':28s} confirmados en caída: {en_caida:8d} ({en_caida / caida:10,.0f} msg/s)"
+              f"  total: {total:6.2f} s  pico en disco: {pico / 1024 / 1024:.1f} MB"
+              f"  limpiezas fallidas: {fallidas}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
@@ -0,0 +1,99 @@
+"""
+Normalización de lotes de actividad para `messagereport` (sin dependencias de red).
+
+ActivityLogger (.NET) envía `timestamp` con el formato fijo "yyyy-MM-ddTHH:mm:ssZ",
+que datetime.fromisoformat resuelve directamente; dateutil queda solo como respaldo
+para formatos inesperados. Como muchos eventos comparten el mismo segundo, el
+resultado del parseo se cachea por cadena.
+
+Cada documento lleva `event_key` (índice único en `messagereport`) para que un
+mensaje reentregado o reintentado no se inserte dos veces.
+"""
+import json
+import hashlib
+from functools import lru_cache
+from datetime import datetime, timezone
+from dateutil import parser
+
+# --- Utils ---
+def normalize_utc(dt: datetime | None) -> datetime | None:
+    """Devuelve dt como datetime 'aware' en UTC. Si dt es None, devuelve None."""
+    if dt is None:
+        return None
+    if not isinstance(dt, datetime):
+        return None
+    if dt.tzinfo is None:
+        # dato 'naive' -> asumimos que estaba en UTC
+        return dt.replace(tzinfo=timezone.utc)
+    # asegurar UTC
+    return dt.astimezone(timezone.utc)
+
+@lru_cache(maxsize=16384)
+def parse_timestamp(ts_raw: str) -> datetime | None:
+    try:
+        ts_parsed = datetime.fromisoformat(ts_raw)
+    except ValueError:
+        try:
+            ts_parsed = parser.parse(ts_raw)
+        except Exception:
+            ts_parsed = None
+    return normalize_utc(ts_parsed)
+
+def clave_evento(mensaje, ts_raw):
+    """
+    Clave de idempotencia del evento: `idempotency_key` si el cliente la envía;
+    si no, un hash de email/message_id/estado/timestamp. Sin timestamp original
+    no hay forma de distinguir dos eventos iguales, así que se devuelve None.
+    """
+    clave = mensaje.get("idempotency_key")
+    if isinstance(clave, str) and clave:
+        return clave
+    if not isinstance(ts_raw, str) or not ts_raw:
+        return None
+    base = f'{mensaje.get("email")}|{mensaje.get("message_id")}|{mensaje.get("estado")}|{ts_raw}'
+    return hashlib.blake2b(base.encode(), digest_size=16).hexdigest()
+
+def decodificar_lote(cuerpos):
+    """
+    Decodifica todos los cuerpos JSON con una sola llamada a json.loads.
+    Si alguno es inválido, se decodifica uno por uno y se descartan los inválidos.
+    """
+    try:
+        mensajes = json.loads(b"[" + b",".join(cuerpos) + b"]")
+        if len(mensajes) == len(cuerpos) and all(isinstance(m, dict) for m in mensajes):
+            return mensajes
+    except ValueError:
+        pass
+    mensajes = []
+    for cuerpo in cuerpos:
+        try:
+            mensaje = json.loads(cuerpo)
+        except ValueError as e:
+            print(f"Error procesando mensaje: {e}")
+            continue
+        if isinstance(mensaje, dict):
+            mensajes.append(mensaje)
+    return mensajes
+
+def normalizar_lote(mensajes, secuencia_inicio, now_utc):
+    """Construye los documentos de `messagereport` a partir de los mensajes decodificados."""
+    documentos = []
+    agregar = documentos.append
+    for i, mensaje in enumerate(mensajes, secuencia_inicio):
+        get = mensaje.get
+        # timestamp del evento (si no viene o es inválido, usamos now_utc)
+        ts_raw = get("timestamp")
+        ts_final = (parse_timestamp(ts_raw) if isinstance(ts_raw, str) and ts_raw else None) or now_utc
+        documento = {
+            "message_id": get("message_id"),
+            "email": get("email"),
+            "zona": get("zona"),
+            "estado": get("estado"),
+            "timestamp": ts_final,            # siempre 'aware' en UTC
+            "item_id": i
+        }
+        clave = clave_evento(mensaje, ts_raw)
+        if clave is not None:
+            documento["event_key"] = clave
+        agregar(documento)
+    return documentos
@@ -1,10 +1,16 @@
 import os
-import json
+import sys
+import shutil
 import time
 import pika
-from pymongo import MongoClient, ReturnDocument, ASCENDING
+import threading
+import multiprocessing
+from collections import Counter
+from pymongo import MongoClient, ReturnDocument, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from datetime import datetime, timezone
-from dateutil import parser
+from ingest import decodificar_lote, normalizar_lote
+from spill import SegmentLog, SpillLleno
 from dateutil.relativedelta import relativedelta
 
 # ==========================
@@ -21,6 +27,29 @@ rabbitmq_user = os.getenv('RABBITMQ_USERNAME')
 rabbitmq_pass = os.getenv('RABBITMQ_PASSWORD')
 rabbitmq_queue = os.getenv('RABBITMQ_QUEUE', 'activity_queue')
 
+# Volcado por lotes: cada MONITOR_BATCH_SIZE mensajes o MONITOR_FLUSH_MS milisegundos
+batch_size = int(os.getenv('MONITOR_BATCH_SIZE', 1000))
+flush_ms = int(os.getenv('MONITOR_FLUSH_MS', 500))
+prefetch_count = int(os.getenv('MONITOR_PREFETCH', batch_size * 2))
+clean_interval = int(os.getenv('MONITOR_CLEAN_INTERVAL', 600))
+clean_chunk_size = int(os.getenv('MONITOR_CLEAN_CHUNK_SIZE', 1000))
+# Consumidores en paralelo sobre la misma cola (cada uno en su propio proceso)
+monitor_workers = int(os.getenv('MONITOR_WORKERS', 1))
+# Registro local (write-ahead) entre RabbitMQ y MongoDB; vacío = insertar directo en MongoDB
+spill_dir = os.getenv('MONITOR_SPILL_DIR', 'spill')
+spill_segment_mb = int(os.getenv('MONITOR_SPILL_SEGMENT_MB', 64))
+spill_max_mb = int(os.getenv('MONITOR_SPILL_MAX_MB', 1024))
+spill_backoff_max = float(os.getenv('MONITOR_SPILL_BACKOFF_MAX', 30))
+
+# Formato de messagereport: documents (un documento por evento) o timeseries
+messagereport_storage = os.getenv('messagereport_storage', 'documents')
+# Retención de eventos crudos en días (TTL); 0 = sin expiración. Los acumulados no expiran
+retention_days = int(os.getenv('messagereport_retention_days', 0))
+
+DUPLICATE_KEY = 11000
+TIMESERIES_COLLECTION = "messagereport_events"
+CAMPOS_META = ("message_id", "zona", "estado")
+
 # ==========================
 #   Conexión a MongoDB
 # ==========================
@@ -28,13 +57,97 @@ mongo_uri = f"mongodb://{mongo_user}:{mongo_password}@{mongo_bdd_server}:27017/"
 mongo_client = MongoClient(mongo_uri)
 mongo_db = mongo_client[mongo_bdd]
 collection = mongo_db["messagereport"]
+timeseries = messagereport_storage == "timeseries"
+# Colección donde se escriben los eventos según el formato elegido
+eventos = mongo_db[TIMESERIES_COLLECTION] if timeseries else collection
 counters = mongo_db["_counters"]
 users_col = mongo_db["users"]
+rollups = mongo_db["messagereport_daily"]
+activity_col = mongo_db["user_activity"]
+
+def preparar_almacenamiento():
+    """Crea la colección de eventos con sus índices y aplica la retención (idempotente)."""
+    if timeseries:
+        if TIMESERIES_COLLECTION not in mongo_db.list_collection_names():
+            opciones = {"timeseries": {"timeField": "timestamp", "metaField": "meta", "granularity": "minutes"}}
+            if retention_days:
+                opciones["expireAfterSeconds"] = retention_days * 86400
+            mongo_db.create_collection(TIMESERIES_COLLECTION, **opciones)
+        elif retention_days:
+            mongo_db.command("collMod", TIMESERIES_COLLECTION, expireAfterSeconds=retention_days * 86400)
+        # Las colecciones time-series no admiten índices únicos: ver descartar_existentes()
+        eventos.create_index([("meta.message_id", ASCENDING), ("timestamp", ASCENDING)])
+        eventos.create_index([("timestamp", ASCENDING)])
+        eventos.create_index([("event_key", ASCENDING)])
+        return
+
+    collection.create_index([("email", ASCENDING)])
+    preparar_indice_timestamp()
+    # Idempotencia: un evento reentregado no se inserta dos veces (documentos antiguos no tienen clave)
+    collection.create_index(
+        [("event_key", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"event_key": {"$exists": True}}
+    )
+
+def preparar_indice_timestamp():
+    """
+    Índice de timestamp de `messagereport`, TTL si hay retención. No se vuelve a
+    llamar a create_index sobre un índice existente: con otras opciones (TTL o no)
+    MongoDB lo rechaza con IndexOptionsConflict; la retención se ajusta con collMod.
+    """
+    ttl = retention_days * 86400
+    actual = collection.index_information().get("timestamp_1")
+    if actual is None:
+        opciones = {"expireAfterSeconds": ttl} if ttl else {}
+        collection.create_index([("timestamp", ASCENDING)], **opciones)
+    elif ttl and actual.get("expireAfterSeconds") != ttl:
+        mongo_db.command("collMod", "messagereport", index={
+            "keyPattern": {"timestamp": 1},
+            "expireAfterSeconds": ttl
+        })
+    elif not ttl and "expireAfterSeconds" in actual:
+        print("⚠️ messagereport_retention_days=0 pero timestamp_1 sigue siendo TTL; "
+              "eliminar el índice a mano para desactivar la expiración")
+
+def campo(nombre):
+    """Ruta del campo en el formato almacenado (meta.* en time-series)."""
+    return f"meta.{nombre}" if timeseries and nombre in CAMPOS_META else nombre
 
-# Índices recomendados (idempotentes)
-collection.create_index([("email", ASCENDING)])
-collection.create_index([("timestamp", ASCENDING)])
-users_col.create_index([("email", ASCENDING)], unique=False)
+def preparar_indices():
+    """Índices recomendados (idempotentes)."""
+    preparar_almacenamiento()
+    users_col.create_index([("email", ASCENDING)], unique=False)
+    activity_col.create_index([("email", ASCENDING)], unique=True)
+    activity_col.create_index([("last_activity", ASCENDING)])
+    rollups.create_index(
+        [("day", ASCENDING), ("message_id", ASCENDING), ("estado", ASCENDING), ("zona", ASCENDING)],
+        unique=True
+    )
+
+# Se marca cuando los índices existen: recién entonces se inserta en MongoDB
+# (el índice único de event_key es el que descarta las reentregas)
+mongo_listo = threading.Event()
+
+def preparar_mongo(sembrar=False):
+    """
+    Paso de arranque: crea índices y almacenamiento y, con `sembrar`, siembra
+    user_activity la primera vez. Si MongoDB no responde reintenta con backoff
+    (hasta spill_backoff_max segundos) sin frenar el consumo hacia el registro local.
+    """
+    espera = 1
+    while True:
+        try:
+            preparar_indices()
+            # Primera ejecución con datos previos: se siembra user_activity una sola vez
+            if sembrar and activity_col.estimated_document_count() == 0 and eventos.estimated_document_count() > 0:
+                backfill_last_activity()
+            break
+        except PyMongoError as e:
+            print(f"❌ MongoDB no disponible al preparar índices: {e}. Reintentando en {espera:.0f} s")
+            time.sleep(espera)
+            espera = min(espera * 2, spill_backoff_max)
+    mongo_listo.set()
 
 # ==========================
 #   Conexión a RabbitMQ
@@ -66,127 +179,501 @@ def get_next_sequence(name, cantidad):
     )
     return result["seq"]
 
-# --- Utils ---
-def normalize_utc(dt: datetime | None) -> datetime | None:
-    """Devuelve dt como datetime 'aware' en UTC. Si dt es None, devuelve None."""
-    if dt is None:
-        return None
-    if not isinstance(dt, datetime):
-        return None
-    if dt.tzinfo is None:
-        # dato 'naive' -> asumimos que estaba en UTC
-        return dt.replace(tzinfo=timezone.utc)
-    # asegurar UTC
-    return dt.astimezone(timezone.utc)
-
-def procesar_mensajes():
-    """Consume hasta 10,000 mensajes por ciclo y los vuelca en MongoDB."""
-    connection = pika.BlockingConnection(parameters)
-    channel = connection.channel()
-    channel.queue_declare(queue=rabbitmq_queue, durable=True)
+def actualizar_rollups(documentos):
+    """
+    Suma los documentos insertados a los acumulados diarios de `messagereport_daily`
+    (una fila por día UTC, message_id, estado y zona) con upserts $inc en un solo bulk_write.
+    """
+    conteos = Counter(
+        (
+            doc["timestamp"].replace(hour=0, minute=0, second=0, microsecond=0),
+            doc["message_id"],
+            doc["estado"],
+            doc["zona"],
+        )
+        for doc in documentos
+    )
+    operaciones = [
+        UpdateOne(
+            {"day": day, "message_id": message_id, "estado": estado, "zona": zona},
+            {"$inc": {"count": cantidad}},
+            upsert=True
+        )
+        for (day, message_id, estado, zona), cantidad in conteos.items()
+    ]
+    if operaciones:
+        rollups.bulk_write(operaciones, ordered=False)
+
+def backfill_rollups():
+    """
+    Recalcula `messagereport_daily` desde todo `messagereport`.
+    Reemplaza las filas existentes; ejecutarlo con el monitor detenido.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "day": {"$dateTrunc": {"date": "$timestamp", "unit": "day"}},
+                "message_id": f"${campo('message_id')}",
+                "estado": f"${campo('estado')}",
+                "zona": f"${campo('zona')}",
+            },
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": False,
+            "day": "$_id.day",
+            "message_id": "$_id.message_id",
+            "estado": "$_id.estado",
+            "zona": "$_id.zona",
+            "count": True
+        }},
+        {"$merge": {
+            "into": "messagereport_daily",
+            "on": ["day", "message_id", "estado", "zona"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    eventos.aggregate(pipeline, allowDiskUse=True)
+    print(f"📊 backfill_rollups(): {rollups.count_documents({})} filas en messagereport_daily")
+
+def a_serie_temporal(doc):
+    """Documento plano -> medición time-series (message_id/zona/estado en meta)."""
+    fila = {k: v for k, v in doc.items() if k not in CAMPOS_META}
+    fila["meta"] = {k: doc[k] for k in CAMPOS_META}
+    return fila
 
-    mensajes = []
-    ack_tags = []
+def descartar_existentes(documentos):
+    """
+    Sin índice único en time-series, la idempotencia se verifica antes de insertar:
+    se descartan los event_key que ya están guardados en el rango de fechas del lote.
+    """
+    claves = [doc["event_key"] for doc in documentos if "event_key" in doc]
+    if not claves:
+        return documentos
+    fechas = [doc["timestamp"] for doc in documentos]
+    existentes = {
+        fila["event_key"] for fila in eventos.find(
+            {"event_key": {"$in": claves}, "timestamp": {"$gte": min(fechas), "$lte": max(fechas)}},
+            {"_id": False, "event_key": True}
+        )
+    }
+    # También se descartan claves repetidas dentro del mismo lote
+    nuevos = []
+    for doc in documentos:
+        clave = doc.get("event_key")
+        if clave is not None:
+            if clave in existentes:
+                continue
+            existentes.add(clave)
+        nuevos.append(doc)
+    if len(nuevos) < len(documentos):
+        print(f"♻️ {len(documentos) - len(nuevos)} mensajes duplicados ignorados")
+    return nuevos
 
-    def recolector(ch, method, properties, body):
+def insertar_documentos(documentos):
+    """
+    insert_many(ordered=False) tratando los duplicados por `event_key` como éxito.
+    Devuelve solo los documentos insertados en esta llamada, que son los que se
+    suman a los acumulados. Si hay otros errores, acumula lo insertado y relanza
+    para que el lote se reencole (en el reintento lo ya insertado será duplicado).
+    """
+    filas = documentos
+    if timeseries:
+        documentos = descartar_existentes(documentos)
+        if not documentos:
+            return []
+        filas = [a_serie_temporal(doc) for doc in documentos]
+    try:
+        eventos.insert_many(filas, ordered=False)
+        return documentos
+    except BulkWriteError as e:
+        errores = e.details.get("writeErrors", [])
+        fallidos = {err["index"] for err in errores}
+        insertados = [doc for i, doc in enumerate(documentos) if i not in fallidos]
+        otros = [err for err in errores if err.get("code") != DUPLICATE_KEY]
+        if otros or e.details.get("writeConcernErrors"):
+            actualizar_acumulados(insertados)
+            raise
+        print(f"♻️ {len(fallidos)} mensajes duplicados ignorados")
+        return insertados
+
+def actualizar_acumulados(documentos):
+    # Fuera del insert: un fallo aquí no debe reencolar registros ya insertados
+    try:
+        actualizar_rollups(documentos)
+    except Exception as e:
+        print(f"❌ Error al actualizar messagereport_daily: {e}")
+    try:
+        actualizar_ultima_actividad(documentos)
+    except Exception as e:
+        print(f"❌ Error al actualizar user_activity: {e}")
+
+def construir_documentos(cuerpos):
+    """Convierte los cuerpos de los mensajes de actividad en documentos de `messagereport`."""
+    mensajes = decodificar_lote(cuerpos)
+    if not mensajes:
+        return []
+    secuencia_final = get_next_sequence("messagereport", len(mensajes))
+    secuencia_inicio = secuencia_final - len(mensajes) + 1
+    return normalizar_lote(mensajes, secuencia_inicio, datetime.now(timezone.utc))
+
+class Lote:
+    """Mensajes consumidos pendientes de volcar a MongoDB."""
+    def __init__(self):
+        self.cuerpos = []
+        self.ultimo_tag = None
+        self.inicio = None
+
+    def agregar(self, cuerpo, tag):
+        if not self.cuerpos:
+            self.inicio = time.monotonic()
+        self.cuerpos.append(cuerpo)
+        self.ultimo_tag = tag
+
+    def listo(self):
+        if not self.cuerpos:
+            return False
+        if len(self.cuerpos) >= batch_size:
+            return True
+        return (time.monotonic() - self.inicio) * 1000 >= flush_ms
+
+    def vaciar(self):
+        self.cuerpos = []
+        self.ultimo_tag = None
+        self.inicio = None
+
+def volcar_lote(channel, lote, registro=None):
+    """
+    Inserta el lote en MongoDB y confirma en RabbitMQ con un solo ack
+    (multiple=True) hasta el último delivery_tag del lote.
+    Con `registro`, el lote se agrega al registro local y el volcador lo inserta después.
+    """
+    if registro is not None:
         try:
-            mensaje = json.loads(body.decode("utf-8"))
-            mensajes.append(mensaje)
-            ack_tags.append(method.delivery_tag)
-        except Exception as e:
-            print(f"Error procesando mensaje: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-
-    channel.basic_qos(prefetch_count=1000)
-    for _ in range(10000):
-        method_frame, header_frame, body = channel.basic_get(rabbitmq_queue)
-        if method_frame:
-            recolector(channel, method_frame, header_frame, body)
-        else:
-            break
+            registro.agregar(lote.cuerpos)
+            channel.basic_ack(delivery_tag=lote.ultimo_tag, multiple=True)
+        except (SpillLleno, OSError) as e:
+            print(f"❌ Error al escribir en el registro local: {e}")
+            channel.basic_nack(delivery_tag=lote.ultimo_tag, multiple=True, requeue=True)
+        finally:
+            lote.vaciar()
+        return
 
-    if mensajes:
-        print(f"📥 Procesando {len(mensajes)} mensajes desde RabbitMQ...")
-        secuencia_final = get_next_sequence("messagereport", len(mensajes))
-        secuencia_inicio = secuencia_final - len(mensajes) + 1
+    inicio = time.monotonic()
+    try:
+        if not mongo_listo.is_set():
+            raise RuntimeError("índices de MongoDB aún no preparados")
+        documentos = construir_documentos(lote.cuerpos)
+        if documentos:
+            documentos = insertar_documentos(documentos)
+        channel.basic_ack(delivery_tag=lote.ultimo_tag, multiple=True)
+        duracion = time.monotonic() - inicio
+        print(f"✅ Insertados {len(documentos)} registros en MongoDB en {duracion * 1000:.0f} ms")
+    except pika.exceptions.AMQPError:
+        raise
+    except Exception as e:
+        print(f"❌ Error al insertar en MongoDB: {e}")
+        channel.basic_nack(delivery_tag=lote.ultimo_tag, multiple=True, requeue=True)
+    else:
+        actualizar_acumulados(documentos)
+    finally:
+        lote.vaciar()
 
-        documentos = []
-        now_utc = datetime.now(timezone.utc)
+def volcar_cuerpos(cuerpos):
+    """Inserta en MongoDB los mensajes leídos de un registro local."""
+    mongo_listo.wait()
+    inicio = time.monotonic()
+    documentos = construir_documentos(cuerpos)
+    if documentos:
+        documentos = insertar_documentos(documentos)
+        actualizar_acumulados(documentos)
+    duracion = time.monotonic() - inicio
+    print(f"✅ Insertados {len(documentos)} registros en MongoDB en {duracion * 1000:.0f} ms")
 
-        for i, mensaje in enumerate(mensajes):
-            # timestamp del evento (si no viene o es inválido, usamos now_utc)
-            ts_raw = mensaje.get("timestamp")
+def drenar_registros_huerfanos():
+    """
+    Vuelca y elimina los registros `worker-N` con N >= monitor_workers, que quedan
+    sin consumidor cuando se baja MONITOR_WORKERS. Reintenta con backoff si MongoDB
+    falla; el directorio solo se borra cuando no queda nada pendiente.
+    """
+    activos = max(monitor_workers, 1)
+    try:
+        nombres = sorted(os.listdir(spill_dir))
+    except FileNotFoundError:
+        return
+    for nombre in nombres:
+        indice = nombre[len("worker-"):]
+        if not nombre.startswith("worker-") or not indice.isdigit() or int(indice) < activos:
+            continue
+        if not mongo_listo.is_set():
+            # En el proceso supervisor no corre ningún trabajador que prepare MongoDB
+            preparar_mongo()
+        directorio = os.path.join(spill_dir, nombre)
+        registro = SegmentLog(
+            directorio,
+            segment_bytes=spill_segment_mb * 1024 * 1024,
+            max_bytes=spill_max_mb * 1024 * 1024
+        )
+        print(f"💾 Volcando el registro de {nombre} ({registro.pendientes} bytes pendientes); "
+              f"MONITOR_WORKERS={monitor_workers}")
+        espera = 1
+        while True:
+            cuerpos, posicion = registro.leer(batch_size, timeout=0)
+            if not cuerpos and posicion == registro.posicion:
+                break
             try:
-                ts_parsed = parser.parse(ts_raw) if ts_raw else None
-            except Exception:
-                ts_parsed = None
+                if cuerpos:
+                    volcar_cuerpos(cuerpos)
+                registro.confirmar(posicion)
+                espera = 1
+            except Exception as e:
+                print(f"❌ Error al volcar el registro de {nombre}: {e}. Reintentando en {espera:.0f} s")
+                time.sleep(espera)
+                espera = min(espera * 2, spill_backoff_max)
+        registro.cerrar()
+        shutil.rmtree(directorio)
+        print(f"🗑️ Registro de {nombre} volcado y eliminado")
 
-            ts_final = normalize_utc(ts_parsed) or now_utc
+def volcador(registro):
+    """
+    Hilo que vacía el registro local hacia MongoDB. Si MongoDB falla, reintenta el
+    mismo tramo con backoff exponencial (hasta spill_backoff_max segundos); el
+    checkpoint solo avanza después de insertar.
+    """
+    espera = 1
+    while True:
+        cuerpos, posicion = registro.leer(batch_size, timeout=flush_ms / 1000)
+        try:
+            if cuerpos:
+                volcar_cuerpos(cuerpos)
+            if posicion != registro.posicion:
+                registro.confirmar(posicion)
+            espera = 1
+        except Exception as e:
+            print(f"❌ Error al volcar el registro local ({registro.pendientes} bytes pendientes): {e}. "
+                  f"Reintentando en {espera:.0f} s")
+            time.sleep(espera)
+            espera = min(espera * 2, spill_backoff_max)
 
-            documentos.append({
-                "message_id": mensaje.get("message_id"),
-                "email": mensaje.get("email"),
-                "zona": mensaje.get("zona"),
-                "estado": mensaje.get("estado"),
-                "timestamp": ts_final,            # siempre 'aware' en UTC
-                "item_id": secuencia_inicio + i
-            })
+def consumir(limpiar=True, registro=None):
+    """
+    Consumidor de larga duración: basic_consume con prefetch, volcando a MongoDB
+    cada `batch_size` mensajes o cada `flush_ms` milisegundos (lo que ocurra primero).
+    Si `limpiar`, clean_users() se ejecuta cada `clean_interval` segundos.
+    """
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.queue_declare(queue=rabbitmq_queue, durable=True)
+    channel.basic_qos(prefetch_count=prefetch_count)
+
+    lote = Lote()
+    procesados = 0
+    inicio = time.monotonic()
+    proxima_limpieza = time.monotonic()
+
+    try:
+        for method, properties, body in channel.consume(rabbitmq_queue, inactivity_timeout=flush_ms / 1000):
+            if method is not None:
+                # Se decodifica al volcar, todo el lote de una vez (los inválidos se descartan)
+                lote.agregar(body, method.delivery_tag)
 
+            if lote.listo():
+                procesados += len(lote.cuerpos)
+                volcar_lote(channel, lote, registro)
+
+            ahora = time.monotonic()
+            if ahora >= proxima_limpieza:
+                if procesados:
+                    print(f"📈 [pid {os.getpid()}] {procesados} mensajes en {ahora - inicio:.0f} s ({procesados / (ahora - inicio):.1f} msg/s)")
+                if registro is not None and registro.pendientes:
+                    print(f"💾 {registro.pendientes} bytes en el registro local pendientes de volcar")
+                procesados = 0
+                inicio = ahora
+                if limpiar:
+                    try:
+                        clean_users()
+                    except PyMongoError as e:
+                        # Con MongoDB caído el consumo sigue hacia el registro local; se reintenta en el próximo intervalo
+                        print(f"❌ clean_users() falló: {e}. Se reintenta en {clean_interval} s")
+                proxima_limpieza = time.monotonic() + clean_interval
+    finally:
         try:
-            collection.insert_many(documentos, ordered=False)
-            print(f"✅ Insertados {len(documentos)} registros en MongoDB")
-            for tag in ack_tags:
-                channel.basic_ack(delivery_tag=tag)
-        except Exception as e:
-            print(f"❌ Error al insertar en MongoDB: {e}")
-            for tag in ack_tags:
-                channel.basic_nack(delivery_tag=tag, requeue=True)
+            channel.cancel()
+            connection.close()
+        except pika.exceptions.AMQPError:
+            pass
 
-    connection.close()
+def actualizar_ultima_actividad(documentos):
+    """
+    Mantiene `user_activity` (email -> last_activity) con upserts $max, un solo
+    bulk_write por lote, para que clean_users no tenga que recorrer `messagereport`.
+    """
+    ultima = {}
+    for doc in documentos:
+        email = doc["email"]
+        if not email:
+            continue
+        ts = doc["timestamp"]
+        if email not in ultima or ts > ultima[email]:
+            ultima[email] = ts
+    operaciones = [
+        UpdateOne({"email": email}, {"$max": {"last_activity": ts}}, upsert=True)
+        for email, ts in ultima.items()
+    ]
+    if operaciones:
+        activity_col.bulk_write(operaciones, ordered=False)
+
+def backfill_last_activity():
+    """Reconstruye `user_activity` desde los eventos guardados (conserva el mayor valor)."""
+    pipeline = [
+        {"$match": {"email": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$email", "last_activity": {"$max": "$timestamp"}}},
+        {"$project": {"_id": False, "email": "$_id", "last_activity": True}},
+        {"$merge": {
+            "into": "user_activity",
+            "on": "email",
+            "whenMatched": [{"$set": {
+                "last_activity": {"$max": ["$last_activity", "$$new.last_activity"]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+    eventos.aggregate(pipeline, allowDiskUse=True)
+    print(f"📊 backfill_last_activity(): {activity_col.count_documents({})} emails en user_activity")
+
+def migrar_a_serie_temporal():
+    """
+    Copia `messagereport` a la colección time-series con $out (la reemplaza).
+    Ejecutarlo con el monitor detenido y antes de escribir eventos en el formato nuevo.
+    """
+    pipeline = [
+        {"$match": {"timestamp": {"$type": "date"}}},
+        {"$project": {
+            "_id": True,
+            "timestamp": True,
+            "email": True,
+            "item_id": True,
+            "event_key": True,
+            "meta": {nombre: f"${nombre}" for nombre in CAMPOS_META}
+        }},
+        {"$out": {
+            "db": mongo_bdd,
+            "coll": TIMESERIES_COLLECTION,
+            "timeseries": {"timeField": "timestamp", "metaField": "meta", "granularity": "minutes"}
+        }}
+    ]
+    collection.aggregate(pipeline, allowDiskUse=True)
+    preparar_almacenamiento()
+    print(f"📦 migrar_a_serie_temporal(): {eventos.estimated_document_count()} eventos en {TIMESERIES_COLLECTION}")
 
 def clean_users():
     """
-    Elimina de `users` a los emails cuya ÚLTIMA actividad en `messagereport`
-    (campo `timestamp`) sea ANTERIOR a (ahora - 4 meses).
+    Elimina de `users` a los emails cuya ÚLTIMA actividad (`user_activity.last_activity`)
+    sea ANTERIOR a (ahora - 4 meses).
     - Solo se consideran emails que aparezcan al menos una vez en `messagereport`.
     - Usuarios sin registros en `messagereport` (nuevos) NO se eliminan.
+    - Consulta por rango sobre un índice y borra en bloques de `clean_chunk_size`,
+      así el costo depende de la cantidad de usuarios y no del historial de reportes.
     """
     now_utc = datetime.now(timezone.utc)
     cutoff = now_utc - relativedelta(months=4)     # aware (UTC)
 
-    # Agrupamos por email y obtenemos el ÚLTIMO timestamp registrado
-    pipeline = [
-        {"$match": {"email": {"$exists": True, "$ne": None, "$ne": ""}}},
-        {"$group": {"_id": "$email", "last_ts": {"$max": "$timestamp"}}}
-    ]
+    cursor = activity_col.find(
+        {"last_activity": {"$lt": cutoff}},
+        {"_id": False, "email": True}
+    ).batch_size(clean_chunk_size)
 
-    old_emails: list[str] = []
+    eliminados = 0
+    bloque: list[str] = []
 
-    for doc in collection.aggregate(pipeline, allowDiskUse=True):
-        email = doc["_id"]
-        last_ts = normalize_utc(doc.get("last_ts"))  # <-- normalizamos a UTC aware
-        if not email or last_ts is None:
-            continue
-        if last_ts < cutoff:
-            old_emails.append(email)
+    def eliminar(emails):
+        # Otro worker pudo actualizar last_activity después de leer el cursor:
+        # solo se borra lo que sigue inactivo, y en `users` solo esos emails
+        inactivos = {"email": {"$in": emails}, "last_activity": {"$lt": cutoff}}
+        vigentes = [doc["email"] for doc in activity_col.find(inactivos, {"_id": False, "email": True})]
+        if not vigentes:
+            return 0
+        activity_col.delete_many({"email": {"$in": vigentes}, "last_activity": {"$lt": cutoff}})
+        # Los que siguen en user_activity tuvieron actividad entre el find y el delete
+        reactivados = {
+            doc["email"] for doc in activity_col.find({"email": {"$in": vigentes}}, {"_id": False, "email": True})
+        }
+        borrar = [email for email in vigentes if email not in reactivados]
+        if not borrar:
+            return 0
+        return users_col.delete_many({"email": {"$in": borrar}}).deleted_count
+
+    for doc in cursor:
+        bloque.append(doc["email"])
+        if len(bloque) >= clean_chunk_size:
+            eliminados += eliminar(bloque)
+            bloque = []
+    if bloque:
+        eliminados += eliminar(bloque)
 
-    if not old_emails:
+    if not eliminados:
         print(f"🧹 clean_users(): no hay usuarios para eliminar. (cutoff={cutoff.isoformat()})")
         return
 
-    # Eliminación definitiva de la colección `users`
-    res_delete = users_col.delete_many({"email": {"$in": old_emails}})
     print(
-        f"🧹 clean_users(): eliminados {res_delete.deleted_count} usuarios "
+        f"🧹 clean_users(): eliminados {eliminados} usuarios "
         f"con última actividad < {cutoff.date()}."
     )
 
-if __name__ == "__main__":
+def trabajador(indice):
+    """Bucle de un consumidor; solo el worker 0 ejecuta clean_users()."""
+    threading.Thread(target=preparar_mongo, args=(indice == 0,), daemon=True).start()
+    registro = None
+    if spill_dir:
+        # Un registro por worker; lo pendiente de una ejecución anterior se vuelca al iniciar
+        registro = SegmentLog(
+            os.path.join(spill_dir, f"worker-{indice}"),
+            segment_bytes=spill_segment_mb * 1024 * 1024,
+            max_bytes=spill_max_mb * 1024 * 1024
+        )
+        threading.Thread(target=volcador, args=(registro,), daemon=True).start()
     esperar_rabbitmq()
     while True:
-        # 1) Consumir y persistir mensajes
-        procesar_mensajes()
-        # 2) Eliminar usuarios inactivos según última actividad (solo si alguna vez tuvieron registros)
-        clean_users()
-        # 3) Espera 10 minutos
-        time.sleep(600)
+        try:
+            # Consumir y persistir mensajes de forma continua; limpia usuarios inactivos cada clean_interval
+            consumir(limpiar=indice == 0, registro=registro)
+        except pika.exceptions.AMQPError as e:
+            print(f"Conexión con RabbitMQ perdida: {e}")
+            esperar_rabbitmq()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        # python main.py backfill -> recalcula acumulados diarios y última actividad, y termina
+        preparar_mongo()
+        backfill_rollups()
+        backfill_last_activity()
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        # python main.py migrate -> copia messagereport al formato time-series y termina
+        if not timeseries:
+            sys.exit("messagereport_storage debe ser 'timeseries' para migrar")
+        migrar_a_serie_temporal()
+        sys.exit(0)
+
+    if spill_dir:
+        # Registros de workers que ya no existen (se bajó MONITOR_WORKERS)
+        threading.Thread(target=drenar_registros_huerfanos, daemon=True).start()
+
+    if monitor_workers <= 1:
+        trabajador(0)
+
+    # Varios consumidores: procesos 'spawn' (cada uno importa el módulo y abre su
+    # propio MongoClient); el padre solo vigila y reinicia los que terminen.
+    contexto = multiprocessing.get_context("spawn")
+    procesos = {}
+    while True:
+        for indice in range(monitor_workers):
+            proceso = procesos.get(indice)
+            if proceso is None or not proceso.is_alive():
+                if proceso is not None:
+                    print(f"⚠️ Worker {indice} terminó (código {proceso.exitcode}). Reiniciando...")
+                proceso = contexto.Process(target=trabajador, args=(indice,), daemon=True)
+                proceso.start()
+                procesos[indice] = proceso
+        time.sleep(5)
@@ -0,0 +1,255 @@
+"""
+Registro local de escritura anticipada (write-ahead) para el monitor.
+
+El consumidor agrega cada lote al registro (con fsync) y recién entonces confirma
+en RabbitMQ; un hilo aparte vacía el registro hacia MongoDB con reintentos y
+backoff. Así una caída o lentitud de MongoDB no reencola mensajes en RabbitMQ.
+
+Formato en disco (un directorio por worker):
+    000000000001.seg ...  segmentos de solo-agregado; cada registro es
+                          [largo u32][crc32 u32][cuerpo]
+    checkpoint            {"segmento": n, "offset": k} ya volcado a MongoDB
+                          (se reescribe de forma atómica con os.replace)
+
+Recuperación: al abrir, la cola del último segmento se recorta en el último
+registro válido (escritura interrumpida) y la lectura sigue desde el checkpoint.
+Si un write/fsync falla en caliente (disco lleno, EIO), el segmento se recorta
+al último registro completo antes de volver a escribir. El lector verifica el
+crc de cada registro: ante uno corrupto descarta el resto de ese segmento.
+Lo que se vuelva a enviar tras una caída entre el insert y el checkpoint lo
+descarta el índice único de `event_key`.
+"""
+import os
+import json
+import zlib
+import struct
+import threading
+
+CABECERA = struct.Struct(">II")
+EXTENSION = ".seg"
+
+
+class SpillLleno(Exception):
+    """El registro alcanzó `max_bytes` pendientes; el lote debe reencolarse en RabbitMQ."""
+
+
+class SegmentLog:
+    def __init__(self, directorio, segment_bytes=64 * 1024 * 1024, max_bytes=1024 * 1024 * 1024):
+        self.directorio = directorio
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._datos = threading.Condition(self._lock)
+
+        segmentos = self._listar_segmentos()
+        self._lectura = self._leer_checkpoint()
+        if self._lectura is None:
+            self._lectura = (segmentos[0] if segmentos else 1, 0)
+        # Segmentos ya volcados que quedaron por una caída antes de borrarlos
+        for segmento in [s for s in segmentos if s < self._lectura[0]]:
+            os.remove(self._ruta(segmento))
+            segmentos.remove(segmento)
+        self._activo = segmentos[-1] if segmentos else self._lectura[0]
+        fin = self._reparar(self._activo)
+        if self._lectura[0] == self._activo and self._lectura[1] > fin:
+            # El checkpoint apunta más allá de lo recuperado (cola recortada)
+            self._lectura = (self._activo, fin)
+        self._archivo = open(self._ruta(self._activo), "ab")
+        self._tamano_activo = fin
+        # Un write/fsync falló y el segmento activo aún no se pudo recortar
+        self._sucio = False
+        # Hasta dónde hay datos con fsync (lo único que el lector puede ver)
+        self._confirmado = (self._activo, fin)
+        self._pendientes = sum(os.path.getsize(self._ruta(s)) for s in segmentos) - self._lectura[1]
+
+    # --- Archivos ---
+    def _ruta(self, segmento):
+        return os.path.join(self.directorio, f"{segmento:012d}{EXTENSION}")
+
+    def _listar_segmentos(self):
+        return sorted(
+            int(nombre[:-len(EXTENSION)])
+            for nombre in os.listdir(self.directorio)
+            if nombre.endswith(EXTENSION)
+        )
+
+    def _leer_checkpoint(self):
+        try:
+            with open(os.path.join(self.directorio, "checkpoint")) as f:
+                datos = json.load(f)
+            return datos["segmento"], datos["offset"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _escribir_checkpoint(self, posicion):
+        ruta = os.path.join(self.directorio, "checkpoint")
+        temporal = ruta + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump({"segmento": posicion[0], "offset": posicion[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+        self._fsync_directorio()
+
+    def _fsync_directorio(self):
+        fd = os.open(self.directorio, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _reparar(self, segmento):
+        """Recorta un registro incompleto o corrupto al final del segmento; devuelve el tamaño válido."""
+        ruta = self._ruta(segmento)
+        if not os.path.exists(ruta):
+            return 0
+        valido = 0
+        with open(ruta, "rb") as f:
+            while True:
+                cabecera = f.read(CABECERA.size)
+                if len(cabecera) < CABECERA.size:
+                    break
+                largo, crc = CABECERA.unpack(cabecera)
+                cuerpo = f.read(largo)
+                if len(cuerpo) < largo or zlib.crc32(cuerpo) != crc:
+                    break
+                valido = f.tell()
+        if valido < os.path.getsize(ruta):
+            print(f"⚠️ Segmento {segmento} con cola incompleta: se recorta a {valido} bytes")
+            os.truncate(ruta, valido)
+        return valido
+
+    # --- Escritura (hilo del consumidor) ---
+    def agregar(self, cuerpos):
+        """Agrega un lote con un solo write + fsync. Al volver, los mensajes son durables."""
+        datos = b"".join(CABECERA.pack(len(c), zlib.crc32(c)) + c for c in cuerpos)
+        with self._lock:
+            if self._pendientes + len(datos) > self.max_bytes:
+                raise SpillLleno(f"{self._pendientes} bytes pendientes de volcar")
+            if self._sucio:
+                self._restaurar()
+            if self._tamano_activo >= self.segment_bytes:
+                self._rotar()
+            try:
+                self._archivo.write(datos)
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+            except OSError:
+                # Sin recortar, los bytes parciales desalinearían a los registros siguientes
+                self._sucio = True
+                try:
+                    self._restaurar()
+                except OSError as e:
+                    print(f"⚠️ No se pudo recortar el segmento {self._activo}: {e}")
+                raise
+            self._tamano_activo += len(datos)
+            self._pendientes += len(datos)
+            self._confirmado = (self._activo, self._tamano_activo)
+            self._datos.notify()
+
+    def _restaurar(self):
+        """Recorta el segmento activo al último registro completo y lo vuelve a abrir."""
+        try:
+            self._archivo.close()
+        except OSError:
+            pass  # close() reintenta vaciar el búfer: lo que escriba se recorta abajo
+        os.truncate(self._ruta(self._activo), self._tamano_activo)
+        self._archivo = open(self._ruta(self._activo), "ab")
+        self._sucio = False
+
+    def _rotar(self):
+        archivo = open(self._ruta(self._activo + 1), "ab")
+        self._archivo.close()
+        self._activo += 1
+        self._archivo = archivo
+        self._tamano_activo = 0
+        self._confirmado = (self._activo, 0)
+        self._fsync_directorio()
+
+    # --- Lectura (hilo del volcador) ---
+    def leer(self, maximo, timeout=None):
+        """
+        Devuelve (cuerpos, posicion) con hasta `maximo` registros desde el checkpoint.
+        No avanza el checkpoint: hay que llamar a confirmar(posicion) tras volcarlos.
+        """
+        with self._lock:
+            if self._lectura == self._confirmado:
+                self._datos.wait(timeout)
+            confirmado = self._confirmado
+        segmento, offset = self._lectura
+        cuerpos = []
+        archivo = None
+        try:
+            while len(cuerpos) < maximo:
+                limite = confirmado[1] if segmento == confirmado[0] else None
+                if archivo is None:
+                    archivo = open(self._ruta(segmento), "rb")
+                    archivo.seek(offset)
+                cabecera = archivo.read(CABECERA.size) if limite is None or offset < limite else b""
+                if len(cabecera) < CABECERA.size:
+                    if segmento >= confirmado[0]:
+                        break
+                    # Fin de un segmento ya rotado: se continúa en el siguiente
+                    archivo.close()
+                    archivo = None
+                    segmento, offset = segmento + 1, 0
+                    continue
+                largo, crc = CABECERA.unpack(cabecera)
+                cuerpo = archivo.read(largo)
+                if len(cuerpo) < largo or zlib.crc32(cuerpo) != crc:
+                    # No se puede confiar en el largo: se descarta el resto del segmento
+                    print(f"⚠️ Registro corrupto en el segmento {segmento}, offset {offset}: "
+                          f"se descarta el resto del segmento")
+                    with self._lock:
+                        if segmento == self._activo:
+                            self._rotar()
+                        confirmado = self._confirmado
+                    archivo.close()
+                    archivo = None
+                    segmento, offset = segmento + 1, 0
+                    continue
+                cuerpos.append(cuerpo)
+                offset += CABECERA.size + largo
+        finally:
+            if archivo is not None:
+                archivo.close()
+        return cuerpos, (segmento, offset)
+
+    def confirmar(self, posicion):
+        """Persiste el checkpoint y elimina los segmentos ya volcados por completo."""
+        self._escribir_checkpoint(posicion)
+        with self._lock:
+            anterior = self._lectura
+            self._lectura = posicion
+            self._pendientes = max(0, self._pendientes - self._distancia(anterior, posicion))
+            activo = self._activo
+        for segmento in range(anterior[0], min(posicion[0], activo)):
+            try:
+                os.remove(self._ruta(segmento))
+            except FileNotFoundError:
+                pass
+
+    def _distancia(self, desde, hasta):
+        if desde[0] == hasta[0]:
+            return hasta[1] - desde[1]
+        total = os.path.getsize(self._ruta(desde[0])) - desde[1] if os.path.exists(self._ruta(desde[0])) else 0
+        for segmento in range(desde[0] + 1, hasta[0]):
+            if os.path.exists(self._ruta(segmento)):
+                total += os.path.getsize(self._ruta(segmento))
+        return total + hasta[1]
+
+    @property
+    def posicion(self):
+        """Posición (segmento, offset) del checkpoint actual."""
+        return self._lectura
+
+    @property
+    def pendientes(self):
+        """Bytes agregados que todavía no se volcaron a MongoDB."""
+        return self._pendientes
+
+    def cerrar(self):
+        with self._lock:
+            self._archivo.close()
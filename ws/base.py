@@ -1,7 +1,13 @@
 import os
 import jwt
-from pymongo import MongoClient
-from tornado.web import RequestHandler
+import hashlib
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from tornado.web import RequestHandler, Finish
+from token_cache import TokenCache
+from encoder import encode_json
+from projections import projection_cache
+from metrics import mongo_listener, request_duration, requests_in_flight, auth_failures
 
 # Variables de entorno
 mongo_bdd = os.getenv('mongo_bdd')
@@ -9,35 +15,145 @@ mongo_bdd_server = os.getenv('mongo_bdd_server')
 mongo_user = os.getenv('mongo_user')
 mongo_password = os.getenv('mongo_password')
 jwt_secret = os.getenv('jwt_secret', 'supersecreto')
+mongo_pool_size = int(os.getenv('mongo_pool_size', 100))
+token_cache_size = int(os.getenv('token_cache_size', 10000))
+token_cache_ttl = int(os.getenv('token_cache_ttl', 300))
 
-# Conexión a MongoDB
-client = MongoClient(f'mongodb://{mongo_user}:{mongo_password}@{mongo_bdd_server}/')
-db = client[mongo_bdd]
-counter_collection = db['_counters']
+# Conexión a MongoDB (cliente asíncrono, un único pool por proceso).
+# El cliente se crea en el primer uso y se vuelve a crear si cambia el PID,
+# de modo que cada worker creado con fork tenga su propio pool.
+_client = None
+_client_pid = None
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = AsyncIOMotorClient(
+            f'mongodb://{mongo_user}:{mongo_password}@{mongo_bdd_server}/',
+            maxPoolSize=mongo_pool_size,
+            event_listeners=[mongo_listener]
+        )
+        _client_pid = os.getpid()
+    return _client
+
+def close_client():
+    global _client
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client = None
+
+class LazyDatabase:
+    """Proxy de la base de datos que resuelve el cliente del proceso actual."""
+    def __getitem__(self, name):
+        return get_client()[mongo_bdd][name]
+
+    def __getattr__(self, name):
+        return getattr(get_client()[mongo_bdd], name)
+
+db = LazyDatabase()
+
+# Caché de tokens verificados (compartida por todos los handlers del proceso)
+token_cache = TokenCache(max_size=token_cache_size, ttl=token_cache_ttl)
+
+def verify_token(token):
+    """Valida un JWT (con caché). Devuelve None si es válido o el mensaje de error."""
+    if token_cache.get(token, jwt_secret) is not None:
+        return None
+    try:
+        payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
+        token_cache.put(token, jwt_secret, payload)
+        return None
+    except jwt.ExpiredSignatureError:
+        auth_failures.inc("expired")
+        return "Token expirado"
+    except jwt.InvalidTokenError:
+        auth_failures.inc("invalid")
+        return "Token inválido"
+
+def compute_validator(docs):
+    """
+    ETag estable a partir de (item_id, timestamp) de cada documento, sin serializarlos.
+    CatalogHandler actualiza `timestamp` en cada post/patch, por lo que cualquier
+    alta, baja o modificación cambia el validador.
+    """
+    digest = hashlib.sha1()
+    max_ts = None
+    for doc in docs:
+        ts = doc.get('timestamp')
+        if isinstance(ts, datetime) and (max_ts is None or ts > max_ts):
+            max_ts = ts
+        digest.update(f"{doc.get('item_id', doc.get('_id'))}|{ts}\n".encode())
+    max_ts_ms = int(max_ts.timestamp() * 1000) if max_ts is not None else 0
+    return f'"{len(docs)}-{max_ts_ms}-{digest.hexdigest()[:16]}"'
 
 class BaseHandler(RequestHandler):
+    # Peticiones en curso en este proceso (para el cierre ordenado)
+    in_flight = 0
+
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
-        self.set_header("Access-Control-Allow-Headers", "Authorization, Content-Type")
+        self.set_header("Access-Control-Allow-Headers", "Authorization, Content-Type, If-None-Match")
+        self.set_header("Access-Control-Expose-Headers", "Etag")
         self.set_header("Access-Control-Allow-Methods", "GET, POST, PATCH, DELETE, OPTIONS")
 
+    def write_json(self, data):
+        # Serializa BSON -> bytes en una sola pasada (sin ida y vuelta por json_util)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(encode_json(data))
+
+    def write_json_conditional(self, data, docs, projection=None):
+        # Responde 304 sin cuerpo si el cliente ya tiene la versión vigente de `docs`.
+        # Con fields= los documentos pueden no traer item_id/timestamp: el validador es el hash del cuerpo
+        if projection is None:
+            self.set_header("Etag", compute_validator(docs))
+            if self.check_etag_header():
+                self.set_status(304)
+                return
+            return self.write_json(data)
+        body = encode_json(data)
+        self.set_header("Etag", f'"p-{hashlib.blake2b(body, digest_size=12).hexdigest()}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(body)
+
+    def get_projection(self, required=()):
+        """Proyección del parámetro fields= (None si no se envió); si es inválido responde 400."""
+        try:
+            return projection_cache.fields(self.get_query_argument('fields', None), required)
+        except ValueError as e:
+            self.set_status(400)
+            self.write_json({'response': str(e), 'status': 400})
+            raise Finish()
+
     def options(self, *args, **kwargs):
         self.set_status(204)
         self.finish()
 
+    def on_finish(self):
+        name = type(self).__name__
+        # Tornado puede terminar la petición sin llegar a prepare() (p. ej. 405)
+        if getattr(self, '_counted', False):
+            BaseHandler.in_flight -= 1
+            requests_in_flight.dec(name)
+        request_duration.observe(
+            self.request.request_time(), name, self.request.method, self.get_status()
+        )
+
     def prepare(self):
+        self._counted = True
+        BaseHandler.in_flight += 1
+        requests_in_flight.inc(type(self).__name__)
         if self.request.method != "OPTIONS":
             auth_header = self.request.headers.get("Authorization", "")
             if not auth_header.startswith("Bearer "):
+                auth_failures.inc("missing")
                 self.set_status(401)
                 self.finish({"error": "Token no proporcionado"})
                 return
             token = auth_header.replace("Bearer ", "")
-            try:
-                jwt.decode(token, jwt_secret, algorithms=["HS256"])
-            except jwt.ExpiredSignatureError:
-                self.set_status(401)
-                self.finish({"error": "Token expirado"})
-            except jwt.InvalidTokenError:
+            error = verify_token(token)
+            if error:
                 self.set_status(401)
-                self.finish({"error": "Token inválido"})
+                self.finish({"error": error})
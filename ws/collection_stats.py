@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+
+stats_max_staleness = int(os.getenv('stats_max_staleness', 60))
+
+
+class CollectionStats:
+    """
+    Conteos y tamaños de colecciones servidos desde memoria.
+    - Los valores se recalculan como máximo cada `max_staleness` segundos.
+    - Si varias peticiones piden el mismo valor vencido, se hace una sola consulta.
+    - CatalogHandler ajusta los conteos en cada alta/baja, así que dentro del
+      proceso el valor no espera al vencimiento para reflejar sus propias escrituras.
+    """
+
+    def __init__(self, max_staleness=60):
+        self.max_staleness = max_staleness
+        self.hits = 0
+        self.misses = 0
+        self._values = {}
+        self._pending = {}
+
+    async def _cached(self, key, loader):
+        entry = self._values.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(loader())
+            self._pending[key] = future
+            try:
+                value = await future
+                self._values[key] = (time.monotonic() + self.max_staleness, value)
+                return value
+            finally:
+                self._pending.pop(key, None)
+        return await future
+
+    async def count(self, db, collection, exact=False):
+        """Estimado por metadatos (O(1)); exact=True usa count_documents (recorre el índice _id)."""
+        if exact:
+            return await self._cached(('exact', collection), lambda: db[collection].count_documents({}))
+        return await self._cached(('estimated', collection), lambda: db[collection].estimated_document_count())
+
+    async def group_members(self, db):
+        async def load():
+            pipeline = [
+                {"$group": {"_id": "$group", "count": {"$sum": 1}}},
+                {"$project": {"_id": False, "group": "$_id", "count": True}},
+                {"$sort": {"group": 1}}
+            ]
+            return await db["usersgroup"].aggregate(pipeline).to_list(length=None)
+        return await self._cached(('groups',), load)
+
+    async def catalog_sizes(self, db):
+        async def load():
+            sizes = []
+            for name in sorted(await db.list_collection_names()):
+                if name.startswith("system."):
+                    continue
+                cursor = db[name].aggregate([{"$collStats": {"storageStats": {}}}])
+                stats = (await cursor.to_list(length=1) or [{}])[0].get("storageStats", {})
+                sizes.append({
+                    "collection": name,
+                    "count": stats.get("count", 0),
+                    "size": stats.get("size", 0),
+                    "storage_size": stats.get("storageSize", 0),
+                    "index_size": stats.get("totalIndexSize", 0)
+                })
+            return sizes
+        return await self._cached(('catalogs',), load)
+
+    def adjust(self, collection, delta):
+        """Aplica un alta/baja conocida a los conteos en caché sin consultar MongoDB."""
+        for key in (('estimated', collection), ('exact', collection)):
+            entry = self._values.get(key)
+            if entry is not None:
+                self._values[key] = (entry[0], max(0, entry[1] + delta))
+        if collection == 'usersgroup':
+            self._values.pop(('groups',), None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'max_staleness': self.max_staleness,
+            'keys': len(self._values),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+collection_stats = CollectionStats(max_staleness=stats_max_staleness)
@@ -0,0 +1,44 @@
+import json
+import datetime
+from bson import ObjectId, json_util
+from bson.decimal128 import Decimal128
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json de la librería estándar
+    orjson = None
+
+EPOCH_AWARE = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _encode_datetime(dt):
+    """Mismo formato que json_util (modo relajado): {"$date": "YYYY-MM-DDTHH:MM:SS[.mmm]Z"}."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    else:
+        dt = dt.astimezone(datetime.timezone.utc)
+    if EPOCH_AWARE <= dt:
+        millis = dt.microsecond // 1000
+        fracsecs = ".%03d" % millis if millis else ""
+        return {"$date": "%s%sZ" % (dt.strftime("%Y-%m-%dT%H:%M:%S"), fracsecs)}
+    millis = int((dt - EPOCH_AWARE).total_seconds() * 1000)
+    return {"$date": {"$numberLong": str(millis)}}
+
+
+def bson_default(obj):
+    """Convierte tipos BSON a su representación Extended JSON relajada."""
+    if isinstance(obj, ObjectId):
+        return {"$oid": str(obj)}
+    if isinstance(obj, datetime.datetime):
+        return _encode_datetime(obj)
+    if isinstance(obj, Decimal128):
+        return {"$numberDecimal": str(obj)}
+    # Cualquier otro tipo BSON poco común se delega en json_util
+    return json_util.default(obj, json_util.RELAXED_JSON_OPTIONS)
+
+
+def encode_json(obj):
+    """Serializa documentos BSON directamente a bytes JSON en una sola pasada."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=bson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(obj, default=bson_default, ensure_ascii=False, separators=(",", ":")).encode()
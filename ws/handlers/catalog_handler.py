@@ -1,109 +1,395 @@
+import os
 import datetime
 from tornado.escape import json_decode
+from tornado.iostream import StreamClosedError
+from tornado.web import Finish
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from base import db, BaseHandler
-from helpers import get_next_id, build_projection, safe_json
+from encoder import encode_json
+from helpers import get_next_id, id_allocator, build_projection, encode_cursor, decode_cursor
+from schedule_cache import schedule_cache, today_cache
+from indexes import ensure_catalog_indexes
+from subscriptions import hub, ws_change_streams
+from collection_stats import collection_stats
+
+page_size_max = int(os.getenv('catalog_page_size_max', 1000))
+stream_batch_size = int(os.getenv('catalog_stream_batch_size', 500))
+
+# Catálogos de los que depende /search/today
+TODAY_SOURCES = ('usersgroup', 'messagesgroup', 'messages')
+
+SCHEDULE_ERROR = "Formato inválido para 'schedule'. Debe ser ISO 8601"
+ITEM_ERROR = "Cada elemento debe ser un objeto JSON"
+BODY_ERROR = "El cuerpo debe ser JSON válido (objeto, arreglo o NDJSON)"
+
+
+class InvalidLine:
+    """Línea NDJSON que no se pudo decodificar; se informa en el resultado de su índice."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def item_error(index, data):
+    """Resultado 400 si el elemento no es un objeto JSON válido, o None."""
+    if isinstance(data, InvalidLine):
+        return {'index': index, 'status': 400, 'error': f"JSON inválido: {data.error}"}
+    if not isinstance(data, dict):
+        return {'index': index, 'status': 400, 'error': ITEM_ERROR}
+    return None
+
+
+def parse_schedule(data):
+    """Convierte `schedule` ISO 8601 a datetime; lanza ValueError si es inválido."""
+    if "schedule" in data and isinstance(data["schedule"], str):
+        data["schedule"] = datetime.datetime.fromisoformat(data["schedule"])
 
 
 class CatalogHandler(BaseHandler):
-    def post(self, catalog):
-        data = json_decode(self.request.body)
+    def parse_body(self):
+        """
+        Devuelve un objeto, o una lista si el cuerpo es un arreglo JSON o NDJSON.
+        En NDJSON cada línea se decodifica por separado (las inválidas quedan como
+        InvalidLine); si el cuerpo no es JSON válido responde 400.
+        """
+        content_type = self.request.headers.get("Content-Type", "")
+        try:
+            if "ndjson" in content_type:
+                lines = self.request.body.decode("utf-8").splitlines()
+                return [self.decode_line(line) for line in lines if line.strip()]
+            data = json_decode(self.request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, (dict, list)):
+            self.set_status(400)
+            self.write_json({'response': BODY_ERROR, 'status': 400})
+            raise Finish()
+        return data
+
+    @staticmethod
+    def decode_line(line):
+        try:
+            return json_decode(line)
+        except ValueError as e:
+            return InvalidLine(str(e))
+
+    def invalidate_caches(self, catalog, group=None):
+        if catalog == 'messagesgroup':
+            schedule_cache.invalidate(group)
+        if catalog in TODAY_SOURCES:
+            today_cache.invalidate()
+
+    def publish_changes(self, catalog, upserted=(), deleted=()):
+        # Con change streams activos el hub recibe los cambios desde MongoDB
+        if catalog != 'messagesgroup' or ws_change_streams:
+            return
+        for doc in upserted:
+            hub.publish_upsert(doc)
+        for doc in deleted:
+            hub.publish_delete(doc['_id'])
+
+    async def post(self, catalog):
+        data = self.parse_body()
+        if isinstance(data, list):
+            return await self.post_many(catalog, data)
+
+        try:
+            parse_schedule(data)
+        except ValueError:
+            self.set_status(400)
+            self.write_json({
+                "response": SCHEDULE_ERROR,
+                "status": 400
+            })
+            return
+
         collection = db[catalog]
-        item_id = get_next_id(catalog)
+        await ensure_catalog_indexes(db, catalog)
+        item_id = await get_next_id(catalog)
         data['item_id'] = item_id
         data['timestamp'] = datetime.datetime.utcnow()
 
-        if "schedule" in data and isinstance(data["schedule"], str):
+        result = await collection.insert_one(data)
+        data['_id'] = result.inserted_id
+        collection_stats.adjust(catalog, 1)
+        self.invalidate_caches(catalog, data.get('group'))
+        self.publish_changes(catalog, upserted=[data])
+
+        self.write_json({'response': data, 'status': 200})
+
+    async def post_many(self, catalog, items):
+        """
+        Inserción masiva: toma los item_id del asignador hi/lo (un solo $inc
+        para lotes grandes) y escribe con insert_many(ordered=False).
+        Devuelve el resultado de cada elemento.
+        """
+        collection = db[catalog]
+        now = datetime.datetime.utcnow()
+        results = [None] * len(items)
+        valid = []
+
+        for index, data in enumerate(items):
+            error = item_error(index, data)
+            if error:
+                results[index] = error
+                continue
             try:
-                data["schedule"] = datetime.datetime.fromisoformat(data["schedule"])
+                parse_schedule(data)
             except ValueError:
-                self.set_status(400)
-                self.write({
-                    "response": "Formato inválido para 'schedule'. Debe ser ISO 8601",
-                    "status": 400
-                })
-                return
+                results[index] = {'index': index, 'status': 400, 'error': SCHEDULE_ERROR}
+                continue
+            valid.append((index, data))
 
-        result = collection.insert_one(data)
-        data['_id'] = result.inserted_id
+        if valid:
+            await ensure_catalog_indexes(db, catalog)
+            ids = await id_allocator.take(catalog, len(valid))
+            documents = []
+            for offset, (index, data) in enumerate(valid):
+                data['item_id'] = ids[offset]
+                data['timestamp'] = now
+                documents.append(data)
+
+            failed = {}
+            try:
+                await collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    failed[error['index']] = error.get('errmsg')
+
+            for offset, (index, data) in enumerate(valid):
+                if offset in failed:
+                    results[index] = {'index': index, 'status': 500, 'error': failed[offset]}
+                else:
+                    results[index] = {'index': index, 'item_id': data['item_id'], 'status': 200}
+
+            collection_stats.adjust(catalog, len(documents) - len(failed))
+            self.invalidate_caches(catalog)
+            self.publish_changes(
+                catalog, upserted=[d for o, d in enumerate(documents) if o not in failed]
+            )
 
-        self.write({'response': safe_json(data), 'status': 200})
+        self.write_json({'response': results, 'status': 200})
 
-    def get(self, catalog):
+    async def get(self, catalog):
         collection = db[catalog]
         item_id = self.get_query_argument('id', None)
-        output_model = self.get_argument('output_model', default=None)
-        projection = build_projection(output_model)
+        # fields= (común a las búsquedas) u output_model (JSON); item_id se necesita para paginar
+        projection = self.get_projection(required=('item_id',))
+        if projection is None:
+            projection = build_projection(self.get_argument('output_model', default=None))
 
         if item_id:
             try:
                 item_id = int(item_id)
             except ValueError:
                 self.set_status(400)
-                return self.write({'error': 'item_id debe ser un entero'})
+                return self.write_json({'error': 'item_id debe ser un entero'})
 
-            result = collection.find_one({"item_id": item_id}, projection)
+            result = await collection.find_one({"item_id": item_id}, projection)
             if result:
-                self.write({'response': safe_json(result), 'status': 200})
+                self.write_json({'response': result, 'status': 200})
             else:
                 self.set_status(404)
-                self.write({'response': 'Elemento no encontrado', 'status': 404})
+                self.write_json({'response': 'Elemento no encontrado', 'status': 404})
         else:
-            cursor = collection.find({}, projection)
-            items = list(cursor)
-            self.write({'response': safe_json(items), 'status': 200})
+            limit = self.get_query_argument('limit', None)
+            after = self.get_query_argument('after', None)
+            stream = self.get_query_argument('stream', None)
+
+            query = {}
+            if after:
+                last_id = decode_cursor(after)
+                if last_id is None:
+                    self.set_status(400)
+                    return self.write_json({'error': 'cursor after inválido'})
+                query['item_id'] = {'$gt': last_id}
+
+            if stream:
+                if stream not in ('ndjson', 'json'):
+                    self.set_status(400)
+                    return self.write_json({'error': "stream debe ser 'ndjson' o 'json'"})
+                return await self.stream_items(collection, query, projection, stream)
+
+            if limit is None and not after:
+                cursor = collection.find({}, projection)
+                items = await cursor.to_list(length=None)
+                return self.write_json({'response': items, 'status': 200})
+
+            try:
+                limit = min(int(limit or page_size_max), page_size_max)
+                if limit <= 0:
+                    raise ValueError
+            except ValueError:
+                self.set_status(400)
+                return self.write_json({'error': 'limit debe ser un entero positivo'})
+
+            # Keyset sobre item_id: se pide un elemento extra para saber si hay otra página
+            cursor = collection.find(query, projection).sort('item_id', 1).limit(limit + 1)
+            items = await cursor.to_list(length=limit + 1)
+            next_cursor = None
+            if len(items) > limit:
+                items = items[:limit]
+                next_cursor = encode_cursor(items[-1]['item_id'])
+            self.write_json({'response': items, 'next': next_cursor, 'status': 200})
+
+    async def stream_items(self, collection, query, projection, fmt):
+        """Escribe el catálogo por lotes del cursor (NDJSON o arreglo JSON) con flush por lote."""
+        cursor = collection.find(query, projection).sort('item_id', 1).batch_size(stream_batch_size)
+        if fmt == 'ndjson':
+            self.set_header("Content-Type", "application/x-ndjson")
+        else:
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.write(b'{"response":[')
+
+        first = True
+        try:
+            while True:
+                batch = await cursor.to_list(length=stream_batch_size)
+                if not batch:
+                    break
+                if fmt == 'ndjson':
+                    chunk = b"".join(encode_json(doc) + b"\n" for doc in batch)
+                else:
+                    chunk = b",".join(encode_json(doc) for doc in batch)
+                    if not first:
+                        chunk = b"," + chunk
+                first = False
+                self.write(chunk)
+                await self.flush()
+        except StreamClosedError:
+            # El cliente cerró la conexión: se libera el cursor y se termina
+            await cursor.close()
+            return
+
+        if fmt == 'json':
+            self.write(b'],"status":200}')
+        self.finish()
+
+    async def patch(self, catalog):
+        data = self.parse_body()
+        if isinstance(data, list):
+            return await self.patch_many(catalog, data)
 
-    def patch(self, catalog):
-        data = json_decode(self.request.body)
         item_id = data.get("item_id")
         if item_id is None:
             self.set_status(400)
-            return self.write({'error': 'item_id es obligatorio'})
+            return self.write_json({'error': 'item_id es obligatorio'})
 
         try:
             item_id = int(item_id)
         except ValueError:
             self.set_status(400)
-            return self.write({'error': 'item_id debe ser un entero'})
+            return self.write_json({'error': 'item_id debe ser un entero'})
 
-        if "schedule" in data and isinstance(data["schedule"], str):
-            try:
-                data["schedule"] = datetime.datetime.fromisoformat(data["schedule"])
-            except ValueError:
-                self.set_status(400)
-                return self.write({
-                    "response": "Formato inválido para 'schedule'. Debe ser ISO 8601",
-                    "status": 400
-                })
+        try:
+            parse_schedule(data)
+        except ValueError:
+            self.set_status(400)
+            return self.write_json({
+                "response": SCHEDULE_ERROR,
+                "status": 400
+            })
 
         collection = db[catalog]
         data['timestamp'] = datetime.datetime.utcnow()
 
         data_to_set = {k: v for k, v in data.items() if k != "item_id"}
-        result = collection.update_one({"item_id": item_id}, {"$set": data_to_set})
+        result = await collection.update_one({"item_id": item_id}, {"$set": data_to_set})
+        # El grupo pudo cambiar: se invalida toda la caché de agendas
+        self.invalidate_caches(catalog)
 
         if result.matched_count == 0:
             self.set_status(404)
-            return self.write({'response': 'Elemento no encontrado', 'status': 404})
+            return self.write_json({'response': 'Elemento no encontrado', 'status': 404})
+
+        updated = await collection.find_one({"item_id": item_id})
+        self.publish_changes(catalog, upserted=[updated] if updated else [])
+        self.write_json({'response': updated, 'status': 200})
+
+    async def patch_many(self, catalog, items):
+        """Actualización masiva con bulk_write(ordered=False); resultado por elemento."""
+        collection = db[catalog]
+        now = datetime.datetime.utcnow()
+        results = [None] * len(items)
+        pending = []
+
+        for index, data in enumerate(items):
+            error = item_error(index, data)
+            if error:
+                results[index] = error
+                continue
+            try:
+                item_id = int(data.get("item_id"))
+            except (TypeError, ValueError):
+                results[index] = {'index': index, 'status': 400, 'error': 'item_id debe ser un entero'}
+                continue
+            try:
+                parse_schedule(data)
+            except ValueError:
+                results[index] = {'index': index, 'item_id': item_id, 'status': 400, 'error': SCHEDULE_ERROR}
+                continue
+            data['timestamp'] = now
+            pending.append((index, item_id, {k: v for k, v in data.items() if k != "item_id"}))
+
+        # Un solo find para saber qué item_id existen (bulk_write solo da totales)
+        ids = [item_id for _, item_id, _ in pending]
+        existing = set()
+        if ids:
+            cursor = collection.find({"item_id": {"$in": ids}}, {"_id": False, "item_id": True})
+            existing = {doc["item_id"] for doc in await cursor.to_list(length=None)}
+
+        operations = []
+        targets = []
+        for index, item_id, data_to_set in pending:
+            if item_id not in existing:
+                results[index] = {'index': index, 'item_id': item_id, 'status': 404, 'error': 'Elemento no encontrado'}
+                continue
+            operations.append(UpdateOne({"item_id": item_id}, {"$set": data_to_set}))
+            targets.append((index, item_id))
+
+        if operations:
+            failed = {}
+            try:
+                await collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    failed[error['index']] = error.get('errmsg')
+
+            for offset, (index, item_id) in enumerate(targets):
+                if offset in failed:
+                    results[index] = {'index': index, 'item_id': item_id, 'status': 500, 'error': failed[offset]}
+                else:
+                    results[index] = {'index': index, 'item_id': item_id, 'status': 200}
+
+            self.invalidate_caches(catalog)
+            if catalog == 'messagesgroup' and not ws_change_streams:
+                updated_ids = [item_id for offset, (_, item_id) in enumerate(targets) if offset not in failed]
+                cursor = collection.find({"item_id": {"$in": updated_ids}})
+                self.publish_changes(catalog, upserted=await cursor.to_list(length=None))
 
-        updated = collection.find_one({"item_id": item_id})
-        self.write({'response': safe_json(updated), 'status': 200})
+        self.write_json({'response': results, 'status': 200})
 
-    def delete(self, catalog):
+    async def delete(self, catalog):
         item_id = self.get_query_argument('id', None)
         if not item_id:
             self.set_status(400)
-            return self.write({'error': 'Debe enviar item_id en la URL'})
+            return self.write_json({'error': 'Debe enviar item_id en la URL'})
 
         try:
             item_id = int(item_id)
         except ValueError:
             self.set_status(400)
-            return self.write({'error': 'item_id debe ser un entero'})
+            return self.write_json({'error': 'item_id debe ser un entero'})
 
         collection = db[catalog]
-        result = collection.delete_one({"item_id": item_id})
-        if result.deleted_count == 0:
+        # find_one_and_delete devuelve el _id eliminado para notificar a los suscriptores
+        deleted = await collection.find_one_and_delete({"item_id": item_id}, {"_id": True})
+        self.invalidate_caches(catalog)
+        if deleted is None:
             self.set_status(404)
-            return self.write({'response': 'Elemento no encontrado', 'status': 404})
+            return self.write_json({'response': 'Elemento no encontrado', 'status': 404})
+        collection_stats.adjust(catalog, -1)
+        self.publish_changes(catalog, deleted=[deleted])
 
-        self.write({'response': 'Elemento eliminado', 'status': 200})
+        self.write_json({'response': 'Elemento eliminado', 'status': 200})
@@ -1,40 +1,182 @@
-import json
-from bson import json_util
+import os
+import io
+import csv
+import zlib
 from datetime import datetime, timezone
+from tornado.iostream import StreamClosedError
 from base import db, BaseHandler
+from encoder import encode_json
+from report_store import report_store
+
+export_batch_size = int(os.getenv('export_batch_size', 2000))
 
 class MessageHandler(BaseHandler):
-    def get(self, message_id=None):
-        collection = db["messagereport"]
+    async def get(self, message_id=None):
+        projection = self.get_projection()
 
         # Rango del año en curso: [01-ene YYYY, ahora]
         now = datetime.now(timezone.utc)
         year_start = datetime(now.year, 1, 1, tzinfo=timezone.utc)
 
-        # Acepta registros cuya fecha esté en rango usando cualquiera de los campos
-        time_filter = {
-            '$or': [
-                {'timestamp': {'$gte': year_start, '$lte': now}},
-                {'timestate': {'$gte': year_start, '$lte': now}},
-            ]
-        }
-
-        query = {'$and': [time_filter]}
-
+        # None = sin filtro; message_id=0 es un filtro válido
+        message_filter = None
         if message_id:
             try:
-                query['$and'].append({'message_id': int(message_id)})
+                message_filter = int(message_id)
             except ValueError:
                 self.set_status(400)
-                self.write({'response': 'message_id inválido', 'status': 400})
+                self.write_json({'response': 'message_id inválido', 'status': 400})
                 return
 
-        # Devuelve solo el año en curso, opcionalmente ordenado por fecha
-        cursor = collection.find(query).sort([('timestamp', 1), ('timestate', 1)])
-        result = list(cursor)
+        # Devuelve solo el año en curso ordenado por fecha (documentos planos en ambos formatos)
+        result = await report_store.find_events(db, year_start, now, message_filter, projection)
 
         if result:
-            self.write({'response': json.loads(json_util.dumps(result)), 'status': 200})
+            self.write_json({'response': result, 'status': 200})
         else:
             self.set_status(404)
-            self.write({'response': 'Mensaje(s) no encontrado(s)', 'status': 404})
+            self.write_json({'response': 'Mensaje(s) no encontrado(s)', 'status': 404})
+
+SUMMARY_DIMENSIONS = ('day', 'message_id', 'estado', 'zona')
+EXPORT_COLUMNS = ('item_id', 'message_id', 'email', 'zona', 'estado', 'timestamp')
+
+class ReportHandler(BaseHandler):
+    def parse_date(self, name):
+        value = self.get_query_argument(name, None)
+        if not value:
+            return None
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+class MessageSummaryHandler(ReportHandler):
+    """
+    Conteos de actividad desde los acumulados diarios `messagereport_daily`
+    que mantiene el monitor. Parámetros opcionales:
+    from/to (fechas ISO, por defecto el año en curso), message_id, estado, zona
+    y group_by (subconjunto de day,message_id,estado,zona separado por comas).
+    """
+    async def get(self):
+        now = datetime.now(timezone.utc)
+        try:
+            date_from = self.parse_date('from') or datetime(now.year, 1, 1, tzinfo=timezone.utc)
+            date_to = self.parse_date('to') or now
+        except ValueError:
+            self.set_status(400)
+            return self.write_json({'response': 'from/to deben ser fechas ISO 8601', 'status': 400})
+
+        match = {'day': {'$gte': date_from, '$lte': date_to}}
+
+        message_id = self.get_query_argument('message_id', None)
+        if message_id:
+            try:
+                match['message_id'] = int(message_id)
+            except ValueError:
+                self.set_status(400)
+                return self.write_json({'response': 'message_id inválido', 'status': 400})
+        for field in ('estado', 'zona'):
+            value = self.get_query_argument(field, None)
+            if value:
+                match[field] = value
+
+        group_by_raw = self.get_query_argument('group_by', None)
+        group_by = [d.strip() for d in group_by_raw.split(',')] if group_by_raw else list(SUMMARY_DIMENSIONS)
+        if not group_by or any(d not in SUMMARY_DIMENSIONS for d in group_by):
+            self.set_status(400)
+            return self.write_json({
+                'response': f"group_by admite: {', '.join(SUMMARY_DIMENSIONS)}",
+                'status': 400
+            })
+
+        result = await report_store.daily_counts(db, match, group_by)
+        self.write_json({'response': result, 'status': 200})
+
+def export_row(doc):
+    ts = doc.get('timestamp') or doc.get('timestate')
+    if isinstance(ts, datetime):
+        ts = (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return [doc.get('item_id'), doc.get('message_id'), doc.get('email'), doc.get('zona'), doc.get('estado'), ts]
+
+class MessageExportHandler(ReportHandler):
+    """
+    Exportación de actividad por streaming desde un cursor del servidor.
+    Parámetros: format (csv por defecto, o ndjson), from/to (fechas ISO, por
+    defecto el año en curso), message_id y estado. Si el cliente acepta gzip
+    (Accept-Encoding), la salida se comprime al vuelo.
+    Se escribe y se hace flush por cada lote de `export_batch_size` filas: la
+    memoria no depende del tamaño de la exportación. Los cursores se ordenan
+    por campos con índice (report_store.export_queries), sin sort bloqueante.
+    """
+    async def get(self):
+        fmt = self.get_query_argument('format', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            self.set_status(400)
+            return self.write_json({'response': "format debe ser 'csv' o 'ndjson'", 'status': 400})
+
+        now = datetime.now(timezone.utc)
+        try:
+            date_from = self.parse_date('from') or datetime(now.year, 1, 1, tzinfo=timezone.utc)
+            date_to = self.parse_date('to') or now
+        except ValueError:
+            self.set_status(400)
+            return self.write_json({'response': 'from/to deben ser fechas ISO 8601', 'status': 400})
+
+        message_filter = None
+        message_id = self.get_query_argument('message_id', None)
+        if message_id:
+            try:
+                message_filter = int(message_id)
+            except ValueError:
+                self.set_status(400)
+                return self.write_json({'response': 'message_id inválido', 'status': 400})
+        estado = self.get_query_argument('estado', None) or None
+
+        cursors = report_store.export_cursors(
+            db, date_from, date_to, message_filter, estado, batch_size=export_batch_size
+        )
+
+        filename = f"messagereport-{date_from.date()}-{date_to.date()}.{fmt}"
+        self.set_header("Content-Type", "text/csv; charset=UTF-8" if fmt == 'csv' else "application/x-ndjson")
+        self.set_header("Content-Disposition", f'attachment; filename="{filename}"')
+        compressor = None
+        if 'gzip' in self.request.headers.get('Accept-Encoding', ''):
+            self.set_header("Content-Encoding", "gzip")
+            self.set_header("Vary", "Accept-Encoding")
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+        def emit(data):
+            if compressor is not None:
+                # Z_SYNC_FLUSH: cada lote sale completo sin esperar al final del gzip
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.write(data)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        try:
+            if fmt == 'csv':
+                writer.writerow(EXPORT_COLUMNS)
+                emit(buffer.getvalue().encode())
+                await self.flush()
+            for cursor in cursors:
+                while True:
+                    batch = await cursor.to_list(length=export_batch_size)
+                    if not batch:
+                        break
+                    if fmt == 'csv':
+                        buffer.seek(0)
+                        buffer.truncate()
+                        writer.writerows(export_row(doc) for doc in batch)
+                        emit(buffer.getvalue().encode())
+                    else:
+                        emit(b"".join(encode_json(doc) + b"\n" for doc in batch))
+                    await self.flush()
+        except StreamClosedError:
+            # El cliente cerró la conexión: se liberan los cursores y se termina
+            for cursor in cursors:
+                await cursor.close()
+            return
+
+        if compressor is not None:
+            self.write(compressor.flush())
+        self.finish()
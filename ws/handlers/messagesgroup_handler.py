@@ -1,36 +1,55 @@
-import json
-from bson import json_util
-from datetime import datetime, timedelta
+from datetime import datetime
 from base import db, BaseHandler
+from schedule_cache import schedule_cache
+from projections import project
 
-class MessagesGroupHandler(BaseHandler):
-    def get(self, group_name):
-        collection = db["messagesgroup"]
-
-        # Calcular rango de fechas del día UTC actual
-        today = datetime.utcnow().date()
-        start_of_day = datetime.combine(today, datetime.min.time())
-        end_of_day = datetime.combine(today, datetime.max.time())
-
-        # Construir query con filtro por grupo y fecha
-        query = {
-            "group": group_name,
-            "schedule": {
-                "$gte": start_of_day,
-                "$lte": end_of_day
-            }
+async def today_schedule(group_name):
+    """Agenda del día UTC actual para un grupo (servida desde schedule_cache si está vigente)."""
+    result = schedule_cache.get(group_name)
+    if result is not None:
+        return result
+
+    generation = schedule_cache.generation(group_name)
+    result = await load_today_schedule(group_name)
+    schedule_cache.put(group_name, result, generation)
+    return result
+
+async def load_today_schedule(group_name):
+    """Agenda del día UTC actual leída de MongoDB, sin pasar por la caché."""
+    collection = db["messagesgroup"]
+
+    # Calcular rango de fechas del día UTC actual
+    today = datetime.utcnow().date()
+    start_of_day = datetime.combine(today, datetime.min.time())
+    end_of_day = datetime.combine(today, datetime.max.time())
+
+    # Construir query con filtro por grupo y fecha
+    query = {
+        "group": group_name,
+        "schedule": {
+            "$gte": start_of_day,
+            "$lte": end_of_day
         }
+    }
+
+    return await collection.find(query).to_list(length=None)
 
-        result = list(collection.find(query))
+class MessagesGroupHandler(BaseHandler):
+    async def get(self, group_name):
+        projection = self.get_projection()
+        result = await today_schedule(group_name)
+        if projection is not None:
+            # La caché guarda documentos completos (los usa también el hub); se proyecta al responder
+            result = [project(doc, projection) for doc in result]
 
         if result:
-            self.write({
-                'response': json.loads(json_util.dumps(result)),
+            self.write_json_conditional({
+                'response': result,
                 'status': 200
-            })
+            }, result, projection)
         else:
             self.set_status(404)
-            self.write({
+            self.write_json({
                 'response': f"No se encontraron mensajes para el grupo '{group_name}' hoy",
                 'status': 404
             })
@@ -0,0 +1,50 @@
+from base import db, BaseHandler, token_cache
+from indexes import explain_report
+from metrics import render_all
+from password_pool import password_pool
+from schedule_cache import schedule_cache, today_cache
+from helpers import id_allocator
+from subscriptions import hub
+from collection_stats import collection_stats
+from projections import projection_cache
+
+class CacheStatsHandler(BaseHandler):
+    def get(self):
+        self.write({
+            'response': {
+                'token_cache': token_cache.stats(),
+                'password_pool': password_pool.stats(),
+                'schedule_cache': schedule_cache.stats(),
+                'today_cache': today_cache.stats(),
+                'id_allocator': id_allocator.stats(),
+                'subscriptions': hub.stats(),
+                'collection_stats': collection_stats.stats(),
+                'projection_cache': projection_cache.stats()
+            },
+            'status': 200
+        })
+
+class CollectionStatsHandler(BaseHandler):
+    async def get(self):
+        self.write_json({
+            'response': {
+                'users': await collection_stats.count(db, "users"),
+                'groups': await collection_stats.group_members(db),
+                'catalogs': await collection_stats.catalog_sizes(db)
+            },
+            'status': 200
+        })
+
+class IndexReportHandler(BaseHandler):
+    async def get(self):
+        report = await explain_report(db)
+        self.write_json({
+            'response': report,
+            'collscan': [item['handler'] for item in report if item['collscan']],
+            'status': 200
+        })
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_all())
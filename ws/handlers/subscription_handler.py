@@ -0,0 +1,97 @@
+from tornado.escape import json_decode
+from tornado.websocket import WebSocketHandler
+from base import verify_token
+from encoder import encode_json
+from metrics import auth_failures
+from subscriptions import hub
+from handlers.messagesgroup_handler import today_schedule
+
+class SubscriptionHandler(WebSocketHandler):
+    """
+    Suscripción a la agenda del día por WebSocket.
+
+    Cliente -> servidor:
+        {"action": "subscribe", "groups": ["Soporte", ...]}
+        {"action": "unsubscribe", "groups": [...]}
+    Servidor -> cliente:
+        {"type": "snapshot", "group": g, "response": [...]}   agenda completa al suscribirse
+        {"type": "insert" | "update" | "delete", "group": g, "item": {...}}
+        {"type": "ping"}        latido periódico
+        {"type": "rollover"}    cambió el día UTC; volver a suscribirse
+    El token va en la cabecera Authorization o en ?token=.
+    """
+
+    def check_origin(self, origin):
+        # Misma política que BaseHandler (Access-Control-Allow-Origin: *)
+        return True
+
+    def prepare(self):
+        auth_header = self.request.headers.get("Authorization", "")
+        token = auth_header.replace("Bearer ", "") if auth_header.startswith("Bearer ") else None
+        token = token or self.get_query_argument("token", None)
+        if not token:
+            auth_failures.inc("missing")
+            self.set_status(401)
+            self.finish({"error": "Token no proporcionado"})
+            return
+        error = verify_token(token)
+        if error:
+            self.set_status(401)
+            self.finish({"error": error})
+
+    def open(self):
+        self.groups = set()
+        # Deltas recibidos por grupo mientras se lee su snapshot
+        self.pending = {}
+
+    def send(self, message):
+        self.write_message(encode_json(message).decode())
+
+    def send_delta(self, group, payload):
+        """Lo llama el hub; hasta enviar el snapshot del grupo, el delta queda en cola."""
+        if group in self.pending:
+            self.pending[group].append(payload)
+        else:
+            self.write_message(payload)
+
+    async def on_message(self, message):
+        try:
+            data = json_decode(message)
+            action = data.get("action")
+            groups = [g for g in data.get("groups", []) if isinstance(g, str) and g]
+        except (ValueError, AttributeError):
+            return self.send({'type': 'error', 'response': 'Mensaje JSON inválido'})
+
+        if action == "subscribe":
+            for group in groups:
+                if group in self.groups:
+                    continue
+                # Primero se suscribe y luego se lee la agenda: ningún cambio queda sin enviar.
+                # Los deltas que lleguen durante la lectura se envían después del snapshot.
+                self.groups.add(group)
+                self.pending[group] = []
+                hub.subscribe(self, group)
+                try:
+                    docs = await today_schedule(group)
+                except Exception:
+                    self.pending.pop(group, None)
+                    hub.unsubscribe(self, [group])
+                    self.groups.discard(group)
+                    raise
+                if group not in self.pending:
+                    # Se canceló la suscripción mientras se leía la agenda
+                    continue
+                hub.remember(docs)
+                self.send({'type': 'snapshot', 'group': group, 'response': docs})
+                for payload in self.pending.pop(group):
+                    self.write_message(payload)
+        elif action == "unsubscribe":
+            hub.unsubscribe(self, groups)
+            self.groups -= set(groups)
+            for group in groups:
+                self.pending.pop(group, None)
+        else:
+            self.send({'type': 'error', 'response': "action debe ser 'subscribe' o 'unsubscribe'"})
+
+    def on_close(self):
+        hub.unsubscribe(self)
@@ -0,0 +1,94 @@
+from datetime import datetime
+from base import db, BaseHandler
+from schedule_cache import today_cache
+from projections import project
+
+# Etapas comunes: unir cada agenda con su mensaje y eliminar duplicados
+# (la misma agenda puede llegar por más de un grupo del usuario).
+# messagesgroup.message_id referencia a messages.item_id.
+JOIN_MESSAGES = [
+    {"$lookup": {
+        "from": "messages",
+        "localField": "message_id",
+        "foreignField": "item_id",
+        "pipeline": [{"$project": {"_id": False}}],
+        "as": "message"
+    }},
+    {"$unwind": {"path": "$message", "preserveNullAndEmptyArrays": True}},
+    {"$group": {
+        "_id": {"message_id": "$message_id", "schedule": "$schedule"},
+        "groups": {"$addToSet": "$group"},
+        "message": {"$first": "$message"}
+    }},
+    {"$project": {
+        "_id": False,
+        "message_id": "$_id.message_id",
+        "schedule": "$_id.schedule",
+        "groups": True,
+        "message": True
+    }},
+    {"$sort": {"schedule": 1, "message_id": 1}}
+]
+
+
+def today_range():
+    today = datetime.utcnow().date()
+    return {
+        "$gte": datetime.combine(today, datetime.min.time()),
+        "$lte": datetime.combine(today, datetime.max.time())
+    }
+
+
+def pipeline_by_email(email):
+    """usersgroup -> messagesgroup (índice group+schedule) -> messages (índice item_id)."""
+    return [
+        {"$match": {"email": email}},
+        {"$lookup": {
+            "from": "messagesgroup",
+            "localField": "group",
+            "foreignField": "group",
+            "pipeline": [{"$match": {"schedule": today_range()}}],
+            "as": "schedules"
+        }},
+        {"$unwind": "$schedules"},
+        {"$replaceRoot": {"newRoot": "$schedules"}},
+    ] + JOIN_MESSAGES
+
+
+def pipeline_by_groups(groups):
+    return [
+        {"$match": {"group": {"$in": groups}, "schedule": today_range()}},
+    ] + JOIN_MESSAGES
+
+
+class TodayHandler(BaseHandler):
+    async def get(self, email=None):
+        projection = self.get_projection()
+        groups_raw = self.get_query_argument('groups', None)
+
+        if email:
+            key = f"email:{email}"
+            collection = db["usersgroup"]
+            pipeline = pipeline_by_email(email)
+        elif groups_raw:
+            groups = sorted({g.strip() for g in groups_raw.split(',') if g.strip()})
+            key = "groups:" + ",".join(groups)
+            collection = db["messagesgroup"]
+            pipeline = pipeline_by_groups(groups)
+        else:
+            self.set_status(400)
+            return self.write_json({'response': 'Debe enviar un email o el parámetro groups', 'status': 400})
+
+        result = today_cache.get(key)
+        if result is None:
+            generation = today_cache.generation(key)
+            result = await collection.aggregate(pipeline).to_list(length=None)
+            today_cache.put(key, result, generation)
+        if projection is not None:
+            result = [project(doc, projection) for doc in result]
+
+        if result:
+            self.write_json({'response': result, 'status': 200})
+        else:
+            self.set_status(404)
+            self.write_json({'response': 'No hay mensajes programados para hoy', 'status': 404})
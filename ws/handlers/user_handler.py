@@ -1,19 +1,21 @@
-import json
-from bson import json_util
 from base import db, BaseHandler
+from collection_stats import collection_stats
 
 class UserHandler(BaseHandler):
-    def get(self, email):
+    async def get(self, email):
         collection = db["users"]
-        result = list(collection.find({"email": email}))
+        # fields=email (sin _id) se resuelve solo con el índice de email
+        projection = self.get_projection()
+        result = await collection.find({"email": email}, projection).to_list(length=None)
         if result:
-            self.write({'response': json.loads(json_util.dumps(result)), 'status': 200})
+            self.write_json_conditional({'response': result, 'status': 200}, result, projection)
         else:
             self.set_status(404)
-            self.write({'response': 'Usuario no encontrado', 'status': 404})
+            self.write_json({'response': 'Usuario no encontrado', 'status': 404})
 
 class UsersCountHandler(BaseHandler):
-    def get(self):
-        collection = db["users"]
-        count = collection.count_documents({})
-        self.write({'response': {'count': count}, 'status': 200})
\ No newline at end of file
+    async def get(self):
+        # Estimado por metadatos y en caché; ?exact=true fuerza count_documents (también en caché)
+        exact = self.get_query_argument('exact', 'false').lower() == 'true'
+        count = await collection_stats.count(db, "users", exact=exact)
+        self.write_json({'response': {'count': count}, 'status': 200})
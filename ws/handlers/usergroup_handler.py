@@ -1,13 +1,13 @@
-import json
-from bson import json_util
 from base import db, BaseHandler
 
 class UserGroupHandler(BaseHandler):
-    def get(self, email):
+    async def get(self, email):
         collection = db["usersgroup"]
-        result = list(collection.find({"email": email}))
+        # fields=group (o email,group) se resuelve solo con el índice email+group
+        projection = self.get_projection()
+        result = await collection.find({"email": email}, projection).to_list(length=None)
         if result:
-            self.write({'response': json.loads(json_util.dumps(result)), 'status': 200})
+            self.write_json_conditional({'response': result, 'status': 200}, result, projection)
         else:
             self.set_status(404)
-            self.write({'response': 'El usuario no tiene grupos asignados', 'status': 404})
+            self.write_json({'response': 'El usuario no tiene grupos asignados', 'status': 404})
@@ -1,27 +1,38 @@
-import json
-from base import counter_collection
-from bson import json_util
+import os
+import base64
+from base import db
+from id_allocator import IdAllocator
+from projections import projection_cache
 
-def get_next_id(catalog):
-    result = counter_collection.find_one_and_update(
+id_block_size = int(os.getenv('id_block_size', 50))
+
+async def get_next_id(catalog):
+    ids = await id_allocator.take(catalog, 1)
+    return ids[0]
+
+async def reserve_ids(catalog, count):
+    """Reserva `count` item_id consecutivos con un solo $inc; devuelve el último."""
+    result = await db['_counters'].find_one_and_update(
         {'_id': catalog},
-        {'$inc': {'seq': 1}},
+        {'$inc': {'seq': count}},
         upsert=True,
         return_document=True
     )
     return result['seq']
 
+# Bloques hi/lo por catálogo arrendados sobre `_counters`
+id_allocator = IdAllocator(reserve_ids, block_size=id_block_size)
+
 def build_projection(output_model_raw):
-    if not output_model_raw:
-        return None
+    # Parseo cacheado (LRU) del JSON de output_model
+    return projection_cache.output_model(output_model_raw)
+
+def encode_cursor(item_id):
+    return base64.urlsafe_b64encode(str(item_id).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
     try:
-        model = json.loads(output_model_raw)
-        model['_id'] = False
-        model['item_id'] = True
-        model['timestamp'] = True
-        return model
+        padded = token + '=' * (-len(token) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
     except Exception:
         return None
-
-def safe_json(obj):
-    return json.loads(json_util.dumps(obj))
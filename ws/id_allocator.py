@@ -0,0 +1,74 @@
+import asyncio
+
+
+class IdAllocator:
+    """
+    Asignador hi/lo de item_id por catálogo.
+    - Cada proceso arrienda bloques de `block_size` ids con un solo $inc sobre
+      `_counters`, por lo que los ids siguen siendo únicos entre varios workers.
+    - Cuando al bloque vigente le quedan `low_watermark` ids o menos, se pide
+      el siguiente en segundo plano para no esperar al agotarse.
+    - Pedidos de `block_size` ids o más se arriendan directamente (rango contiguo).
+    Los ids no usados de un bloque se pierden al reiniciar el proceso (huecos).
+    """
+
+    def __init__(self, lease, block_size=50, low_watermark=None):
+        # lease(catalog, count) -> último id del rango reservado
+        self._lease = lease
+        self.block_size = max(1, block_size)
+        self.low_watermark = low_watermark if low_watermark is not None else self.block_size // 5
+        self.leases = 0
+        self._blocks = {}
+        self._prefetch = {}
+        self._locks = {}
+
+    async def _lease_range(self, catalog, count):
+        self.leases += 1
+        last = await self._lease(catalog, count)
+        return [last - count + 1, last]
+
+    async def _next_block(self, catalog):
+        task = self._prefetch.pop(catalog, None)
+        if task is not None:
+            try:
+                return await task
+            except Exception:
+                pass  # si el arriendo en segundo plano falló, se reintenta en línea
+        return await self._lease_range(catalog, self.block_size)
+
+    def _maybe_prefetch(self, catalog):
+        block = self._blocks.get(catalog)
+        if block is None or catalog in self._prefetch:
+            return
+        if block[1] - block[0] + 1 <= self.low_watermark:
+            self._prefetch[catalog] = asyncio.ensure_future(
+                self._lease_range(catalog, self.block_size)
+            )
+
+    async def take(self, catalog, count=1):
+        """Devuelve una lista de `count` item_id únicos para `catalog`."""
+        if count >= self.block_size:
+            first, last = await self._lease_range(catalog, count)
+            return list(range(first, last + 1))
+
+        lock = self._locks.setdefault(catalog, asyncio.Lock())
+        ids = []
+        async with lock:
+            while len(ids) < count:
+                block = self._blocks.get(catalog)
+                if block is None or block[0] > block[1]:
+                    block = await self._next_block(catalog)
+                    self._blocks[catalog] = block
+                n = min(count - len(ids), block[1] - block[0] + 1)
+                ids.extend(range(block[0], block[0] + n))
+                block[0] += n
+            self._maybe_prefetch(catalog)
+        return ids
+
+    def stats(self):
+        return {
+            'block_size': self.block_size,
+            'low_watermark': self.low_watermark,
+            'leases': self.leases,
+            'remaining': {c: max(0, b[1] - b[0] + 1) for c, b in self._blocks.items()}
+        }
@@ -0,0 +1,175 @@
+"""
+Registro declarativo de índices de ws y diagnóstico de planes de consulta.
+
+- ensure_indexes(): se ejecuta al iniciar ws; crea los índices del registro y el
+  índice de item_id en cada catálogo existente (create_index es idempotente).
+- ensure_catalog_indexes(): se llama al escribir por primera vez en un catálogo.
+- explain_report(): corre explain() sobre la forma de consulta de cada handler
+  y marca las que terminan en COLLSCAN.
+
+Uso por consola:
+    python indexes.py apply
+    python indexes.py explain
+"""
+import sys
+import json
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from report_store import report_store, TIMESERIES_COLLECTION
+
+# Índice común a todo catálogo dinámico de CatalogHandler
+CATALOG_INDEXES = [
+    ([("item_id", ASCENDING)], {}),
+]
+
+# Índices por colección para las consultas de los handlers de búsqueda
+INDEXES = {
+    "users": [
+        ([("email", ASCENDING)], {}),
+    ],
+    "usersgroup": [
+        # email+group cubre UserGroupHandler con fields=group (covered query)
+        ([("email", ASCENDING), ("group", ASCENDING)], {}),
+        ([("group", ASCENDING)], {}),
+    ],
+    "messagesgroup": [
+        ([("group", ASCENDING), ("schedule", ASCENDING)], {}),
+    ],
+    "messagereport": [
+        ([("message_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+        # timestamp_1 lo crea el monitor (TTL si messagereport_retention_days > 0)
+        ([("timestate", ASCENDING)], {"sparse": True}),
+        ([("email", ASCENDING)], {}),
+        # Clave de idempotencia del monitor (misma definición que monitor/main.py)
+        ([("event_key", ASCENDING)],
+         {"unique": True, "partialFilterExpression": {"event_key": {"$exists": True}}}),
+    ],
+    # Última actividad por email que mantiene el monitor para clean_users
+    "user_activity": [
+        ([("email", ASCENDING)], {"unique": True}),
+        ([("last_activity", ASCENDING)], {}),
+    ],
+    # Formato time-series (messagereport_storage=timeseries); no admite índices únicos
+    TIMESERIES_COLLECTION: [
+        ([("meta.message_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+        # Exportación sin message_id: rango y orden por timestamp
+        ([("timestamp", ASCENDING)], {}),
+        ([("event_key", ASCENDING)], {}),
+    ],
+    # Acumulados diarios que mantiene el monitor (misma definición que monitor/main.py)
+    "messagereport_daily": [
+        ([("day", ASCENDING), ("message_id", ASCENDING), ("estado", ASCENDING), ("zona", ASCENDING)],
+         {"unique": True}),
+    ],
+    "managers": [
+        ([("username", ASCENDING)], {}),
+        ([("id", ASCENDING)], {}),
+    ],
+}
+
+# Colecciones internas que no son catálogos
+SKIP_COLLECTIONS = ("_counters",)
+
+# IndexOptionsConflict / IndexKeySpecsConflict: ya existe con otras opciones
+INDEX_CONFLICT_CODES = (85, 86)
+
+_provisioned = set()
+
+
+async def ensure_catalog_indexes(db, catalog):
+    """Crea los índices de un catálogo una sola vez por proceso."""
+    if catalog in _provisioned or catalog in SKIP_COLLECTIONS:
+        return
+    collection = db[catalog]
+    for keys, options in CATALOG_INDEXES + INDEXES.get(catalog, []):
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            # Un índice equivalente con otras opciones no debe frenar el resto
+            print(f"Índice {keys} de {catalog} ya existe con otras opciones: {e}")
+    _provisioned.add(catalog)
+
+
+async def ensure_indexes(db):
+    # La colección time-series la crea el monitor: crearla aquí la dejaría como colección normal
+    names = set(await db.list_collection_names()) | (set(INDEXES) - {TIMESERIES_COLLECTION})
+    for name in sorted(names):
+        if name.startswith("system."):
+            continue
+        await ensure_catalog_indexes(db, name)
+
+
+def query_shapes():
+    """Forma de consulta de cada handler: (nombre, colección, filtro, orden)."""
+    now = datetime.utcnow()
+    start_of_day = datetime.combine(now.date(), datetime.min.time())
+    end_of_day = datetime.combine(now.date(), datetime.max.time())
+    year_start = datetime(now.year, 1, 1)
+    return [
+        ("UserHandler", "users", {"email": "x"}, None),
+        ("UserGroupHandler", "usersgroup", {"email": "x"}, None),
+        ("MessagesGroupHandler", "messagesgroup",
+         {"group": "x", "schedule": {"$gte": start_of_day, "$lte": end_of_day}}, None),
+        ("MessageHandler", report_store.collection_name,
+         *report_store.events_query(year_start, now, 1)),
+        *[("MessageExportHandler", report_store.collection_name, *shape)
+          for shape in report_store.export_queries(year_start, now)],
+        ("MessageSummaryHandler", "messagereport_daily",
+         {"day": {"$gte": year_start, "$lte": now}}, None),
+        ("BackofficeLoginHandler", "managers", {"username": "x"}, None),
+        ("BackofficeUserHandler", "managers", {"id": 1}, None),
+        ("clean_users", "user_activity", {"last_activity": {"$lt": now - timedelta(days=120)}}, None),
+    ]
+
+
+def _stages(plan):
+    """Recorre el árbol del plan y devuelve todas las etapas."""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return [s for s in stages if s]
+
+
+async def explain_report(db):
+    shapes = query_shapes()
+    catalogs = await db.list_collection_names()
+    for name in sorted(catalogs):
+        if name.startswith("system.") or name in SKIP_COLLECTIONS:
+            continue
+        shapes.append((f"CatalogHandler[{name}]", name, {"item_id": 1}, None))
+
+    report = []
+    for handler, collection, query, sort in shapes:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explained = await db.command("explain", command, verbosity="queryPlanner")
+        stages = _stages(explained["queryPlanner"]["winningPlan"])
+        report.append({
+            "handler": handler,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
+
+if __name__ == "__main__":
+    from tornado.ioloop import IOLoop
+    from base import db
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "explain"
+    if command == "apply":
+        IOLoop.current().run_sync(lambda: ensure_indexes(db))
+        print(f"Índices aplicados: {sorted(_provisioned)}")
+    else:
+        report = IOLoop.current().run_sync(lambda: explain_report(db))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if any(item["collscan"] for item in report):
+            sys.exit(1)
@@ -1,16 +1,36 @@
+import os
+import signal
+import asyncio
 from tornado.ioloop import IOLoop
 from tornado.web import Application
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id
 
-from base import BaseHandler
+from base import db, close_client, BaseHandler
+from indexes import ensure_indexes
+from password_pool import password_pool
+from subscriptions import hub, watch_changes, ws_change_streams, ws_resync_interval
 from handlers.catalog_handler import CatalogHandler
 from handlers.usergroup_handler import UserGroupHandler
 from handlers.user_handler import UserHandler
-from handlers.message_handler import MessageHandler
-from handlers.messagesgroup_handler import MessagesGroupHandler
+from handlers.message_handler import MessageHandler, MessageSummaryHandler, MessageExportHandler
+from handlers.messagesgroup_handler import MessagesGroupHandler, load_today_schedule
 from handlers.backoffice_handler import BackofficeUserHandler, BackofficeLoginHandler
 from handlers.user_handler import UsersCountHandler
+from handlers.stats_handler import CacheStatsHandler, CollectionStatsHandler, IndexReportHandler, MetricsHandler
+from handlers.today_handler import TodayHandler
+from handlers.subscription_handler import SubscriptionHandler
 
-def make_app():
+# Variables de entorno
+ws_env = os.getenv('ws_env', 'development')
+ws_port = int(os.getenv('ws_port', 5050))
+ws_workers = int(os.getenv('ws_workers', 0))            # 0 = un worker por núcleo
+ws_reuse_port = os.getenv('ws_reuse_port', '0') == '1'  # cada worker abre su socket con SO_REUSEPORT
+ws_max_restarts = int(os.getenv('ws_max_restarts', 100))
+ws_shutdown_timeout = float(os.getenv('ws_shutdown_timeout', 10))
+
+def make_app(debug=True):
     return Application([
         (r"/", BaseHandler),
         (r"/([^/]+)", CatalogHandler),
@@ -18,15 +38,89 @@ def make_app():
         (r"/search/users/([^/]+)", UserHandler),
         (r"/search/userscount", UsersCountHandler),
         (r"/search/messagereport", MessageHandler),
+        (r"/search/messagereport/summary", MessageSummaryHandler),
         (r"/search/messagereport/([^/]+)", MessageHandler),
         (r"/search/messagesgroup/([^/]+)", MessagesGroupHandler),
+        (r"/export/messagereport", MessageExportHandler),
+        (r"/search/today", TodayHandler),
+        (r"/search/today/([^/]+)", TodayHandler),
         (r"/backoffice/user", BackofficeUserHandler),
         (r"/backoffice/user/([^/]+)", BackofficeUserHandler),
         (r"/backoffice/login", BackofficeLoginHandler),
-    ], debug=True)
+        (r"/stats/cache", CacheStatsHandler),
+        (r"/stats/collections", CollectionStatsHandler),
+        (r"/stats/indexes", IndexReportHandler),
+        (r"/stats/metrics", MetricsHandler),
+        (r"/subscribe/messagesgroup", SubscriptionHandler),
+    ], debug=debug, websocket_max_message_size=64 * 1024)
+
+def forward_signals():
+    """En el proceso padre: reenvía SIGTERM/SIGINT a los workers para un cierre ordenado."""
+    def handler(signum, frame):
+        signal.signal(signum, signal.SIG_IGN)
+        os.killpg(os.getpgrp(), signum)
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+def install_shutdown(server):
+    """
+    Cierre ordenado del worker: deja de aceptar conexiones, espera las peticiones
+    en curso (hasta ws_shutdown_timeout), cierra conexiones y libera recursos.
+    """
+    loop = IOLoop.current()
+
+    async def shutdown():
+        server.stop()
+        deadline = loop.time() + ws_shutdown_timeout
+        while BaseHandler.in_flight > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        try:
+            await asyncio.wait_for(server.close_all_connections(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+        password_pool.shutdown()
+        close_client()
+        loop.stop()
+
+    asyncio_loop = asyncio.get_event_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio_loop.add_signal_handler(sig, lambda: asyncio.ensure_future(shutdown()))
+
+def main():
+    production = ws_env == 'production'
+    sockets = None
+
+    if production and ws_workers != 1 and not ws_change_streams and ws_resync_interval <= 0:
+        print("⚠️ ADVERTENCIA: varios workers sin ws_change_streams ni ws_resync_interval: "
+              "los suscriptores de un worker no verán las escrituras hechas en otro")
+
+    if production:
+        # Pre-fork: cada worker crea su IOLoop y su cliente de MongoDB después del fork.
+        # fork_processes reinicia los workers que terminan de forma anormal.
+        if not ws_reuse_port:
+            sockets = bind_sockets(ws_port)
+        forward_signals()
+        fork_processes(ws_workers, max_restarts=ws_max_restarts)
+        print(f"Worker {task_id()} (pid {os.getpid()}) escuchando en http://localhost:{ws_port}")
+    else:
+        print(f"Servidor escuchando en http://localhost:{ws_port}")
+
+    if sockets is None:
+        sockets = bind_sockets(ws_port, reuse_port=production and ws_reuse_port)
+
+    app = make_app(debug=not production)
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+
+    loop = IOLoop.current()
+    loop.spawn_callback(ensure_indexes, db)
+    if ws_change_streams:
+        loop.spawn_callback(watch_changes, db, hub)
+    else:
+        # Sin change streams: relectura periódica para ver las escrituras de otros workers
+        hub.start_resync(load_today_schedule)
+    install_shutdown(server)
+    loop.start()
 
 if __name__ == "__main__":
-    print("Servidor escuchando en http://localhost:5050")
-    app = make_app()
-    app.listen(5050)
-    IOLoop.current().start()
+    main()
@@ -0,0 +1,176 @@
+"""
+Métricas de ws en formato de texto de Prometheus (sin dependencias externas).
+
+Las métricas son por proceso: en modo producción cada worker expone las suyas
+(la primera línea indica el pid). Los eventos de MongoDB llegan desde los hilos
+de Motor, por eso las actualizaciones van bajo un lock.
+"""
+import os
+import bisect
+import threading
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.label_names, k)} {v}' for k, v in items
+        ]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.label_names, k)} {v}' for k, v in items
+        ]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [conteos por bucket (+Inf al final), suma, total]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self.values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{_labels(self.label_names, labels, [("le", bound)])} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+def render_all():
+    worker = os.getpid()
+    lines = [f'# ws worker pid {worker}']
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Métricas HTTP ---
+request_duration = Histogram(
+    'ws_request_duration_seconds', 'Duración de las peticiones HTTP por handler, método y estado',
+    ('handler', 'method', 'status')
+)
+requests_in_flight = Gauge(
+    'ws_requests_in_flight', 'Peticiones HTTP en curso por handler', ('handler',)
+)
+auth_failures = Counter(
+    'ws_auth_failures_total', 'Rechazos de autenticación en BaseHandler.prepare', ('reason',)
+)
+
+# --- Métricas de MongoDB ---
+mongo_command_duration = Histogram(
+    'ws_mongo_command_duration_seconds', 'Duración de comandos de MongoDB por colección y comando',
+    ('collection', 'command')
+)
+mongo_command_failures = Counter(
+    'ws_mongo_command_failures_total', 'Comandos de MongoDB fallidos por colección y comando',
+    ('collection', 'command')
+)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Mide cada comando con el command monitoring de pymongo."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        command = event.command_name
+        target = event.command.get(command)
+        if command == 'getMore':
+            target = event.command.get('collection')
+        collection = target if isinstance(target, str) else ''
+        self._pending[(event.connection_id, event.request_id)] = (collection, command)
+
+    def succeeded(self, event):
+        key = self._pending.pop((event.connection_id, event.request_id), None)
+        if key is not None:
+            mongo_command_duration.observe(event.duration_micros / 1e6, *key)
+
+    def failed(self, event):
+        key = self._pending.pop((event.connection_id, event.request_id), None)
+        if key is not None:
+            mongo_command_duration.observe(event.duration_micros / 1e6, *key)
+            mongo_command_failures.inc(*key)
+
+
+mongo_listener = MongoCommandListener()
@@ -0,0 +1,85 @@
+import os
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from tornado.ioloop import IOLoop
+
+bcrypt_salt = int(os.getenv("bcrypt_salt", 12))
+bcrypt_workers = int(os.getenv("bcrypt_workers", os.cpu_count() or 2))
+bcrypt_max_pending = int(os.getenv("bcrypt_max_pending", 32))
+bcrypt_executor = os.getenv("bcrypt_executor", "thread")
+
+
+class PasswordPoolSaturated(Exception):
+    """Se lanza cuando la cola de trabajos de bcrypt está llena."""
+
+
+# Funciones a nivel de módulo para que sean serializables en ProcessPoolExecutor
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+class PasswordPool:
+    """
+    Ejecuta hash/verificación de contraseñas fuera del IOLoop.
+    - max_workers limita cuántos bcrypt corren a la vez.
+    - max_pending limita los trabajos en curso + en cola; al superarlo
+      se lanza PasswordPoolSaturated para responder 503 de inmediato.
+    """
+
+    def __init__(self, max_workers, max_pending, kind="thread"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    @property
+    def executor(self):
+        # Se crea de forma perezosa (y por proceso) en el primer uso
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+        self.pending += 1
+        try:
+            return await IOLoop.current().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password, rounds=bcrypt_salt):
+        return await self._run(_hashpw, password, rounds)
+
+    async def check(self, password, hashed):
+        return await self._run(_checkpw, password, hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'rejected': self.rejected
+        }
+
+
+password_pool = PasswordPool(bcrypt_workers, bcrypt_max_pending, bcrypt_executor)
@@ -0,0 +1,117 @@
+import os
+import re
+import json
+from collections import OrderedDict
+
+projection_cache_size = int(os.getenv('projection_cache_size', 256))
+
+FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+MAX_FIELDS = 32
+
+
+def parse_fields(raw, required=()):
+    """
+    fields=email,group -> {'email': True, 'group': True, '_id': False}
+    `_id` solo se devuelve si se pide: sin él, una consulta cuyo filtro y campos
+    estén en un mismo índice se responde solo con el índice (covered query).
+    """
+    names = [name.strip() for name in raw.split(',')]
+    if any(not name for name in names):
+        raise ValueError('fields no admite nombres vacíos')
+    if len(names) > MAX_FIELDS:
+        raise ValueError(f'fields admite como máximo {MAX_FIELDS} campos')
+    for name in names:
+        if not FIELD_PATTERN.match(name):
+            raise ValueError(f"campo inválido en fields: '{name}'")
+
+    names = list(dict.fromkeys(names + list(required)))
+    # MongoDB rechaza proyectar a la vez 'a' y 'a.b' (path collision)
+    for name in names:
+        for other in names:
+            if other.startswith(name + '.'):
+                raise ValueError(f"fields no puede incluir '{name}' y '{other}' a la vez")
+
+    projection = {name: True for name in names}
+    projection.setdefault('_id', False)
+    return projection
+
+
+def parse_output_model(raw):
+    """Formato anterior de CatalogHandler: JSON con los campos; siempre agrega item_id y timestamp."""
+    try:
+        model = json.loads(raw)
+        model['_id'] = False
+        model['item_id'] = True
+        model['timestamp'] = True
+        return model
+    except Exception:
+        return None
+
+
+def project(doc, projection):
+    """Aplica una proyección de inclusión a un documento ya en memoria (p. ej. desde una caché)."""
+    result = {}
+    for path, include in projection.items():
+        if not include:
+            continue
+        source, target = doc, result
+        parts = path.split('.')
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(part, {})
+        else:
+            if parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return result
+
+
+class ProjectionCache:
+    """
+    Caché LRU acotada de proyecciones ya parseadas y validadas, por texto crudo.
+    Las proyecciones devueltas se comparten entre peticiones: no modificarlas.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _cached(self, key, parser):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = parser()
+        self._entries[key] = value
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+    def fields(self, raw, required=()):
+        """Proyección para fields= (None si no se envió). ValueError si es inválida (no se cachea)."""
+        if not raw:
+            return None
+        required = tuple(required)
+        return self._cached(('fields', raw, required), lambda: parse_fields(raw, required))
+
+    def output_model(self, raw):
+        if not raw:
+            return None
+        return self._cached(('output_model', raw), lambda: parse_output_model(raw))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'max_size': self.max_size,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+projection_cache = ProjectionCache(max_size=projection_cache_size)
@@ -0,0 +1,119 @@
+"""
+Capa de consulta de la actividad de mensajes para los handlers de reportes.
+
+`messagereport_storage` indica el formato que escribe el monitor:
+- documents (por defecto): un documento plano por evento en `messagereport`.
+- timeseries: colección time-series `messagereport_events` con timeField=timestamp
+  y metaField=meta (message_id, zona, estado); email, item_id y event_key
+  quedan como campos de la medición.
+
+Los handlers siempre reciben documentos planos con la forma original
+(message_id, email, zona, estado, timestamp, item_id), sin importar el formato.
+"""
+import os
+
+messagereport_storage = os.getenv('messagereport_storage', 'documents')
+
+TIMESERIES_COLLECTION = 'messagereport_events'
+DAILY_COLLECTION = 'messagereport_daily'
+META_FIELDS = ('message_id', 'zona', 'estado')
+
+
+class ReportStore:
+    def __init__(self, storage='documents'):
+        self.timeseries = storage == 'timeseries'
+        self.collection_name = TIMESERIES_COLLECTION if self.timeseries else 'messagereport'
+
+    def field(self, name):
+        """Ruta del campo en el formato almacenado (meta.* en time-series)."""
+        return f'meta.{name}' if self.timeseries and name in META_FIELDS else name
+
+    def events_query(self, start, end, message_id=None, estado=None):
+        """Filtro y orden de eventos en [start, end], opcionalmente de un message_id y estado."""
+        if self.timeseries:
+            query = {'timestamp': {'$gte': start, '$lte': end}}
+            if message_id is not None:
+                query[self.field('message_id')] = message_id
+            if estado is not None:
+                query[self.field('estado')] = estado
+            return query, [('timestamp', 1)]
+
+        # Formato plano: los registros antiguos pueden tener la fecha en `timestate`
+        query = {'$and': [{
+            '$or': [
+                {'timestamp': {'$gte': start, '$lte': end}},
+                {'timestate': {'$gte': start, '$lte': end}},
+            ]
+        }]}
+        if message_id is not None:
+            query['$and'].append({'message_id': message_id})
+        if estado is not None:
+            query['$and'].append({'estado': estado})
+        return query, [('timestamp', 1), ('timestate', 1)]
+
+    def events_cursor(self, db, start, end, message_id=None, estado=None, batch_size=None, projection=None):
+        """Cursor del servidor sobre los eventos, ya en forma plana, para recorrer por lotes."""
+        query, sort = self.events_query(start, end, message_id, estado)
+        collection = db[self.collection_name]
+        if not self.timeseries:
+            cursor = collection.find(query, projection).sort(sort)
+            return cursor.batch_size(batch_size) if batch_size else cursor
+
+        flatten = {name: f'$meta.{name}' for name in META_FIELDS}
+        pipeline = [
+            {'$match': query},
+            {'$sort': dict(sort)},
+            {'$replaceWith': {'$mergeObjects': [flatten, '$$ROOT']}},
+            {'$project': projection or {'meta': False}}
+        ]
+        if batch_size:
+            return collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+        return collection.aggregate(pipeline, allowDiskUse=True)
+
+    def export_queries(self, start, end, message_id=None, estado=None):
+        """
+        Filtros y órdenes de la exportación. Cada uno se ordena por un campo con
+        índice, así el primer lote sale sin un sort bloqueante de todo el rango:
+        en formato plano, primero los eventos con `timestamp` y luego los
+        registros antiguos que solo tienen `timestate`.
+        """
+        if self.timeseries:
+            return [self.events_query(start, end, message_id, estado)]
+        filters = {}
+        if message_id is not None:
+            filters['message_id'] = message_id
+        if estado is not None:
+            filters['estado'] = estado
+        return [
+            (dict(filters, timestamp={'$gte': start, '$lte': end}), [('timestamp', 1)]),
+            (dict(filters, timestamp={'$exists': False}, timestate={'$gte': start, '$lte': end}),
+             [('timestate', 1)]),
+        ]
+
+    def export_cursors(self, db, start, end, message_id=None, estado=None, batch_size=None):
+        """Cursores de la exportación, a recorrer en orden (ver export_queries)."""
+        if self.timeseries:
+            return [self.events_cursor(db, start, end, message_id, estado, batch_size=batch_size)]
+        collection = db[self.collection_name]
+        cursors = []
+        for query, sort in self.export_queries(start, end, message_id, estado):
+            cursor = collection.find(query).sort(sort)
+            cursors.append(cursor.batch_size(batch_size) if batch_size else cursor)
+        return cursors
+
+    async def find_events(self, db, start, end, message_id=None, projection=None):
+        cursor = self.events_cursor(db, start, end, message_id, projection=projection)
+        return await cursor.to_list(length=None)
+
+    async def daily_counts(self, db, match, group_by):
+        """Conteos desde los acumulados diarios (iguales para ambos formatos)."""
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': {d: f'${d}' for d in group_by}, 'count': {'$sum': '$count'}}},
+            {'$project': dict({'_id': False, 'count': True}, **{d: f'$_id.{d}' for d in group_by})},
+            {'$sort': {d: 1 for d in group_by}}
+        ]
+        return await db[DAILY_COLLECTION].aggregate(pipeline).to_list(length=None)
+
+
+report_store = ReportStore(messagereport_storage)
@@ -0,0 +1,102 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+schedule_cache_ttl = int(os.getenv('schedule_cache_ttl', 30))
+schedule_cache_max_entries = int(os.getenv('schedule_cache_max_entries', 10000))
+
+
+class ScheduleCache:
+    """
+    Caché LRU acotada de la agenda del día (UTC) por clave (grupo, email, ...).
+    - Las claves vienen del cliente: como máximo `max_entries` entradas.
+    - Cada entrada vive como máximo `ttl` segundos; las vencidas se borran al leerlas.
+    - Al cambiar el día UTC se descarta todo (rollover a medianoche).
+    - CatalogHandler la invalida al escribir en los catálogos de los que depende.
+    - Cada invalidación sube la generación de la clave (o la global): un put() con
+      la generación leída antes de la consulta no guarda si hubo una escritura
+      mientras tanto, para no dejar en caché el resultado previo a esa escritura.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._day = None
+        self._entries = OrderedDict()
+        self._epoch = 0
+        self._generations = {}
+
+    def _new_epoch(self):
+        # Las generaciones por clave se comparan junto con la época: pueden reiniciarse
+        self._epoch += 1
+        self._generations.clear()
+
+    def _rollover(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self._day:
+            self._entries.clear()
+            self._new_epoch()
+            self._day = today
+        return today
+
+    def generation(self, group):
+        """Leer antes de consultar MongoDB y pasarla a put()."""
+        self._rollover()
+        return self._epoch, self._generations.get(group, 0)
+
+    def get(self, group):
+        self._rollover()
+        entry = self._entries.get(group)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[group]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(group)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, group, docs, generation=None):
+        self._rollover()
+        if generation is not None and generation != (self._epoch, self._generations.get(group, 0)):
+            # Se invalidó durante la consulta: el resultado puede ser anterior a la escritura
+            return
+        self._entries[group] = (time.monotonic() + self.ttl, docs)
+        self._entries.move_to_end(group)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, group=None):
+        self.invalidations += 1
+        if group is None:
+            self._entries.clear()
+            self._new_epoch()
+        else:
+            self._entries.pop(group, None)
+            if len(self._generations) >= self.max_entries and group not in self._generations:
+                # Cota también para las generaciones: una época nueva las descarta
+                self._new_epoch()
+            self._generations[group] = self._generations.get(group, 0) + 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'groups': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+schedule_cache = ScheduleCache(ttl=schedule_cache_ttl, max_entries=schedule_cache_max_entries)
+# Respuestas de /search/today (agenda + mensajes) por email o lista de grupos
+today_cache = ScheduleCache(ttl=schedule_cache_ttl, max_entries=schedule_cache_max_entries)
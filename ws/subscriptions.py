@@ -0,0 +1,223 @@
+"""
+Entrega de agendas por suscripción (WebSocket) en lugar de sondeo.
+
+El hub guarda, por grupo, las conexiones suscritas y envía deltas cuando cambia
+`messagesgroup`. Los cambios llegan por una de dos fuentes:
+- CatalogHandler (por defecto): solo ve las escrituras de este proceso. Con
+  varios workers, cada uno vuelve a leer cada ws_resync_interval segundos las
+  agendas de sus grupos suscritos y envía la diferencia (escrituras hechas
+  por otro worker).
+- Change streams de MongoDB (ws_change_streams=1, requiere replica set): cada
+  worker observa la colección y recibe todas las escrituras; además invalida
+  las cachés de agenda de todos los workers.
+"""
+import os
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from pymongo.errors import PyMongoError
+from tornado.ioloop import PeriodicCallback
+from tornado.websocket import WebSocketClosedError
+from encoder import encode_json
+from schedule_cache import schedule_cache, today_cache
+
+ws_change_streams = os.getenv('ws_change_streams', '0') == '1'
+ws_heartbeat_interval = int(os.getenv('ws_heartbeat_interval', 30))
+# Relectura periódica de los grupos suscritos sin change streams; 0 = desactivada
+ws_resync_interval = int(os.getenv('ws_resync_interval', 10))
+
+
+def is_today(doc):
+    schedule = doc.get('schedule')
+    return isinstance(schedule, datetime) and schedule.date() == datetime.utcnow().date()
+
+
+class SubscriptionHub:
+    def __init__(self, heartbeat_interval=30, resync_interval=0):
+        self.heartbeat_interval = heartbeat_interval
+        self.resync_interval = resync_interval
+        self.deltas = 0
+        self.resyncs = 0
+        self._subscribers = defaultdict(set)
+        # _id de agendas de hoy ya enviadas -> grupo (para bajas y cambios de grupo)
+        self._known = {}
+        # Por grupo: _id -> (_id, timestamp) de lo enviado, para comparar al releer
+        self._sent = defaultdict(dict)
+        # Cambios publicados por grupo: una relectura que se cruzó con uno se descarta
+        self._changes = defaultdict(int)
+        self._day = datetime.utcnow().date()
+        self._heartbeat = None
+        self._resync = None
+
+    def _all_connections(self):
+        return {conn for conns in self._subscribers.values() for conn in conns}
+
+    @property
+    def connections(self):
+        return len(self._all_connections())
+
+    def subscribe(self, conn, group):
+        self._subscribers[group].add(conn)
+        self._start_heartbeat()
+
+    def unsubscribe(self, conn, groups=None):
+        for group in list(groups if groups is not None else self._subscribers):
+            if group not in self._subscribers:
+                continue
+            self._subscribers[group].discard(conn)
+            if not self._subscribers[group]:
+                del self._subscribers[group]
+                self._sent.pop(group, None)
+
+    def _track(self, group, doc):
+        key = str(doc['_id'])
+        self._known[key] = group
+        self._sent[group][key] = (doc['_id'], doc.get('timestamp'))
+
+    def _forget(self, group, key):
+        if self._known.get(key) == group:
+            self._known.pop(key)
+        self._sent.get(group, {}).pop(key, None)
+
+    def remember(self, docs):
+        for doc in docs:
+            self._track(doc.get('group'), doc)
+
+    def _broadcast(self, group, message):
+        conns = self._subscribers.get(group)
+        if not conns:
+            return
+        # Se serializa una sola vez para todos los suscriptores del grupo
+        payload = encode_json(message).decode()
+        for conn in list(conns):
+            try:
+                conn.send_delta(group, payload)
+            except WebSocketClosedError:
+                self.unsubscribe(conn)
+        self.deltas += 1
+
+    def publish_upsert(self, doc):
+        key = str(doc['_id'])
+        previous_group = self._known.get(key)
+        group = doc.get('group')
+        schedule_cache.invalidate(group)
+        self._changes[group] += 1
+        if previous_group is not None and previous_group != group:
+            schedule_cache.invalidate(previous_group)
+            self._changes[previous_group] += 1
+            self._forget(previous_group, key)
+            self._broadcast(previous_group, {'type': 'delete', 'group': previous_group, 'item': {'_id': doc['_id']}})
+        if is_today(doc):
+            op = 'update' if key in self._known else 'insert'
+            self._track(group, doc)
+            self._broadcast(group, {'type': op, 'group': group, 'item': doc})
+        elif key in self._known:
+            # Se reprogramó para otro día: deja de estar en la agenda de hoy
+            self._forget(group, key)
+            self._broadcast(group, {'type': 'delete', 'group': group, 'item': {'_id': doc['_id']}})
+
+    def publish_delete(self, _id):
+        key = str(_id)
+        group = self._known.get(key)
+        if group is not None:
+            self._forget(group, key)
+            self._changes[group] += 1
+            schedule_cache.invalidate(group)
+            self._broadcast(group, {'type': 'delete', 'group': group, 'item': {'_id': _id}})
+
+    def start_resync(self, load):
+        """
+        Relee cada resync_interval segundos la agenda de cada grupo suscrito con
+        `load(group)` (consulta a MongoDB, sin caché) y envía las diferencias.
+        """
+        if self._resync is None and self.resync_interval > 0:
+            self._resync = PeriodicCallback(lambda: self.resync(load), self.resync_interval * 1000)
+            self._resync.start()
+
+    async def resync(self, load):
+        for group in list(self._subscribers):
+            changes = self._changes[group]
+            try:
+                docs = await load(group)
+            except PyMongoError as e:
+                print(f"No se pudo releer la agenda de {group}: {e}")
+                return
+            if group not in self._subscribers or self._changes[group] != changes:
+                # Se publicó un cambio durante la consulta: queda para la próxima relectura
+                continue
+            current = {str(doc['_id']): doc for doc in docs}
+            sent = self._sent[group]
+            messages = []
+            for key, doc in current.items():
+                if key not in sent:
+                    messages.append({'type': 'insert', 'group': group, 'item': doc})
+                elif sent[key][1] != doc.get('timestamp'):
+                    messages.append({'type': 'update', 'group': group, 'item': doc})
+            for key in set(sent) - set(current):
+                messages.append({'type': 'delete', 'group': group, 'item': {'_id': sent[key][0]}})
+            if not messages:
+                continue
+            # Otro worker escribió en el grupo: la caché de este worker también quedó vieja
+            schedule_cache.invalidate(group)
+            self.resyncs += 1
+            for key in set(sent) - set(current):
+                self._forget(group, key)
+            for doc in docs:
+                self._track(group, doc)
+            for message in messages:
+                self._broadcast(group, message)
+
+    def _start_heartbeat(self):
+        # Un único temporizador por proceso, no uno por conexión
+        if self._heartbeat is None and self.heartbeat_interval > 0:
+            self._heartbeat = PeriodicCallback(self._send_heartbeat, self.heartbeat_interval * 1000)
+            self._heartbeat.start()
+
+    def _send_heartbeat(self):
+        today = datetime.utcnow().date()
+        if today != self._day:
+            # Nuevo día UTC: se avisa para que los clientes pidan la agenda de nuevo
+            self._day = today
+            self._known.clear()
+            self._sent.clear()
+            payload = '{"type":"rollover"}'
+        else:
+            payload = '{"type":"ping"}'
+        for conn in self._all_connections():
+            try:
+                conn.write_message(payload)
+            except WebSocketClosedError:
+                self.unsubscribe(conn)
+
+    def stats(self):
+        return {
+            'groups': len(self._subscribers),
+            'connections': self.connections,
+            'known_schedules': len(self._known),
+            'deltas': self.deltas,
+            'resyncs': self.resyncs,
+            'source': 'change_streams' if ws_change_streams else 'catalog_handler'
+        }
+
+
+async def watch_changes(db, hub):
+    """Observa `messagesgroup` con change streams y publica cada cambio en el hub."""
+    collection = db["messagesgroup"]
+    while True:
+        try:
+            async with collection.watch(full_document='updateLookup') as stream:
+                async for change in stream:
+                    operation = change['operationType']
+                    if operation in ('insert', 'update', 'replace'):
+                        doc = change.get('fullDocument')
+                        if doc is not None:
+                            hub.publish_upsert(doc)
+                    elif operation == 'delete':
+                        hub.publish_delete(change['documentKey']['_id'])
+                    today_cache.invalidate()
+        except PyMongoError as e:
+            print(f"Change stream de messagesgroup interrumpido: {e}. Reintentando en 5 segundos...")
+            await asyncio.sleep(5)
+
+
+hub = SubscriptionHub(heartbeat_interval=ws_heartbeat_interval, resync_interval=ws_resync_interval)
@@ -0,0 +1,73 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Caché LRU acotada de tokens JWT ya verificados.
+    - La clave es el sha256 del token crudo (no se guarda el token).
+    - Cada entrada vence en min(ahora + ttl, exp del token).
+    - Si cambia jwt_secret se vacía completa.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Mismo objeto que jwt_secret en base.py: se compara por identidad antes que por valor
+        self._secret = None
+
+    @staticmethod
+    def _digest(value):
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    def _check_secret(self, secret):
+        if secret is not self._secret and secret != self._secret:
+            self._entries.clear()
+            self._secret = secret
+
+    def get(self, token, secret):
+        """Devuelve el payload cacheado o None si no está (o venció)."""
+        self._check_secret(secret)
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, token, secret, payload):
+        self._check_secret(secret)
+        expires_at = time.time() + self.ttl
+        exp = payload.get('exp') if isinstance(payload, dict) else None
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        key = self._digest(token)
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }